@@ -13,6 +13,7 @@ from screens.key_bindings import KeyBindingsScreen
 from screens.user_agreement import UserAgreementScreen
 from constants import VERSION, MENU, PICKER, SETTINGS, STATS, KEY_BIND, USER_AGREE
 from config import CONFIG
+from pacer import enable_vsync
 
 # This is to trigger the initialization of sentry_sdk
 CONFIG.send_log = CONFIG.send_log
@@ -23,18 +24,56 @@ pygame.init()
 __version__ = VERSION
 
 
+class LamaApp(App):
+    """
+    The App of graphalama, pushing to the window only the parts of it that changed.
+
+    App.run flips the whole display after each frame. While it runs, the flips (and updates of the whole
+    display) go through update_display, which lets the screen that drew the frame push only what it drew.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drawn_by = None  # the screen that rendered since the last push, see IdleScreen.render
+        self.pygame_flip = pygame.display.flip
+        self.pygame_update = pygame.display.update
+
+    def update_display(self, rects=None):
+        """Push the given rects of the display to the window, or what the last screen drawn says."""
+        if rects is not None:
+            self.pygame_update(rects)
+            return
+        screen, self.drawn_by = self.drawn_by, None
+        if screen is None:
+            # no screen rendered since the last push, whatever was drawn is pushed whole
+            self.pygame_flip()
+        else:
+            screen.update_display()
+
+    def run(self):
+        pygame.display.flip = pygame.display.update = self.update_display
+        try:
+            super().run()
+        finally:
+            pygame.display.flip = self.pygame_flip
+            pygame.display.update = self.pygame_update
+
+
 def main():
     LOGGER.info("Starting the game.")
     first_time_config = CONFIG.first_time_launch
     start_screen = USER_AGREE if first_time_config else MENU
-    App({
+    app = LamaApp({
         MENU: MenuScreen,
         PICKER: PickerScreen,
         SETTINGS: SettingsScreen,
         STATS: StatisticsScreen,
         KEY_BIND: KeyBindingsScreen,
         USER_AGREE: UserAgreementScreen,
-    }, start_screen).run()
+    }, start_screen)
+    if CONFIG.vsync:
+        app.display = enable_vsync(app.display) or app.display
+    app.run()
     LOGGER.info("Exiting the game.")
 
 
@@ -17,6 +17,7 @@ from constants import DEFAULT_BLOCK_SIZE, MAPS_FOLDER
 from entities import OBJECTS, Spawn, SPAWN
 from level import Level
 from physics import Pos
+from sprites import SPRITES
 
 pygame.init()
 
@@ -40,7 +41,6 @@ class LevelEdit(Level):
     def __init__(self):
         super().__init__()
         self.path = ''
-        self.img_cache = {}
 
     @classmethod
     def load(cls, path, size=(120, 40)):
@@ -62,59 +62,45 @@ class LevelEdit(Level):
 
         LOGGER.info("Creating new empty LevelEdit.")
         level = cls()
-        level.size = Pos(size)
+        level.size = tuple(size)
         level.objects = [Spawn((size[0] // 2, size[1] // 2))]
 
+        lines = []
         for y in range(0, size[1]):
-            line = []
-            for x in range(0, size[0]):
-                if y == size[1] - 1:
-                    line.append(Block.new("B", (x, y)))
-                elif x in (0, size[0] - 1) or y == 0:
-                    line.append(Stone((x, y)))
-                else:
-                    line.append(Block((x, y)))
-            level.grid.append(line)
+            if y == size[1] - 1:
+                lines.append("B" * size[0])
+            elif y == 0:
+                lines.append(Stone.character * size[0])
+            else:
+                lines.append(Stone.character + "." * (size[0] - 2) + Stone.character)
+        level.set_blocks(lines)
+        level.update_maps()
         return level
 
-    def get_img_at(self, map_pos):
-        x, y = map_pos
-        if map_pos not in self.img_cache:
-            neigh = "".join(self.get_block((x + dx, y + dy)).character
-                            for dy in range(-1, 2)
-                            for dx in range(-1, 2))
-            block = self.get_block(map_pos)
-            img = block.get_img(neigh, rotation=block.rotation)
-            self.img_cache[map_pos] = img
-
-        return self.img_cache[map_pos]
-
     def clean_cache_around(self, pos):
         LOGGER.info("Cleaning image cache around %s", pos)
-        for dx in range(-1, 2):
-            for dy in range(-1, 2):
-                p = pos[0] + dx, pos[1] + dy
-                if p in self.img_cache:
-                    del self.img_cache[p]
+        self.invalidate_chunks_around(pos)
 
     def add_block(self, pos, block):
         if 0 <= pos[0] < self.size[0] and 0 <= pos[1] < self.size[1]:
             LOGGER.info("Adding block %s at %s", block, pos)
-            block = BLOCKS[block](pos=pos)
-            self.grid[pos[1]][pos[0]] = block
+            self.set_block(pos, BLOCKS[block](pos=pos))
             self.clean_cache_around(pos)
         else:
             LOGGER.info("Cannot add block %s at %s: position outside of the map.", block, pos)
 
     def erase(self, pos):
+        if not self.inside_map(pos):
+            LOGGER.info("Cannot erase at %s: position outside of the map.", pos)
+            return
         LOGGER.info("Erasing block and objects at %s", pos)
-        self.grid[pos[1]][pos[0]] = Block(pos)
+        self.set_block(pos, Block(pos))
         for obj in self.objects[:]:
             if obj.pos == pos:
                 self.objects.remove(obj)
                 LOGGER.info("Removing object %s.", obj)
                 try:
-                    self.space.projectiles.remove(obj)
+                    self.space.remove(obj)
                     LOGGER.info("Removing it from projectiles too.")
                 except ValueError:
                     pass
@@ -140,14 +126,15 @@ class LevelEdit(Level):
         self.objects.append(obj)
 
     def clear(self):
-        LOGGER.info("Clearing level (map + objects + projectiles + img_cache).")
-        for y, line in enumerate(self.grid):
-            for x, _ in enumerate(line):
-                self.grid[y][x] = Block.new('.', (x, y))
+        LOGGER.info("Clearing level (map + objects + projectiles + chunks).")
+        self.set_blocks([])
+        self.update_maps()
 
         self.objects.clear()
-        self.space.projectiles.clear()  # we we load, object like AK47 are directly added in this list
-        self.img_cache.clear()
+        for proj in self.space.projectiles[:]:  # we we load, object like AK47 are directly added in this list
+            self.space.remove(proj)
+        self.brochettes.clear()
+        self.chunks.clear()
 
     def render(self, surf):
         super().render(surf)
@@ -273,6 +260,23 @@ class EditScreen(Screen):
         elif self.tool == self.ERASER:
             return self.erase_img
 
+    @property
+    def cursor_img(self):
+        """The current_img_under_cursor, scaled to the tiles and half transparent."""
+
+        def make_img():
+            img = pygame.transform.scale(self.current_img_under_cursor, (self.tile_size, ) * 2)
+            img.set_alpha(128)
+            return img
+
+        if self.tool == self.BRUSH:
+            key = self.tool, self.tile_index, self.current_tile.current_frame()
+        elif self.tool == self.OBJECTBRUSH:
+            key = self.tool, self.object_index
+        else:
+            key = self.tool,
+        return SPRITES.get(("cursor", self.tile_size) + key, make_img)
+
     def set_brush_tile(self, i):
         self.tile_index = i
         self.tool = self.BRUSH
@@ -352,11 +356,8 @@ class EditScreen(Screen):
         self.level.render(display)
 
         # cursor
-        img = self.current_img_under_cursor
-        img = pygame.transform.scale(img, (self.tile_size, ) * 2)
-        img.set_alpha(128)
         pos = self.level.map_to_display(self.level.display_to_map(pygame.mouse.get_pos()))
-        display.blit(img, (round(pos[0]), round(pos[1])))
+        display.blit(self.cursor_img, (round(pos[0]), round(pos[1])))
 
         self.widgets.render(display)
 
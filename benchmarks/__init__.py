@@ -0,0 +1,4 @@
+"""
+Micro-benchmarks of pieces of the game. They import the modules of the game as top-level
+modules, so run them as modules from the root of the repository, e.g. python -m benchmarks.pos
+"""
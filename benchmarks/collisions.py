@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Fast bodies against the blocks: the walls they go through, and the blocks they stop at.
+
+A body moving more than a block per tick skips walls unless it is swept (see Body.swept).
+A swept body must stop at the first block on its way, and collide with none behind it.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.collisions
+"""
+import os
+import logging
+import click
+import pygame
+
+from level import Level
+from physics import AABB, Body
+
+
+class SweptBody(Body):
+    swept = True
+
+
+# lines of the map, rect of the body, its velocity, then where it must stop and the only cells it collides with
+CASES = [
+    ("left through lava", ["..L..S..."], (224, 4, 24, 24), (-200, 0), ("left", 192), [(5, 0)]),
+    ("down, lava on the left", [".."] * 5 + [".S"] + [".."] * 4 + ["L.", ".."], (4, 0, 56, 20), (0, 400),
+     ("bottom", 160), [(1, 5)]),
+    ("down, lava on the right", [".."] * 5 + ["S."] + [".."] * 4 + [".L", ".."], (4, 0, 56, 20), (0, 400),
+     ("bottom", 160), [(0, 5)]),
+    ("up through lava", ["..", "L.", "..", "..", ".S", "..", "..", ".."], (4, 200, 56, 20), (0, -200),
+     ("top", 160), [(1, 4)]),
+]
+
+
+def make_level(lines):
+    level = Level()
+    level.size = max(map(len, lines)), len(lines)
+    level.set_blocks(lines)
+    level.update_maps()
+    return level
+
+
+def move(level, body_type, rect, velocity):
+    body = body_type(AABB(rect), mass=0)
+    body.max_velocity = (None, None)
+    body.velocity.x, body.velocity.y = velocity
+    body.update_x(level)
+    body.update_y(level)
+    return body
+
+
+def tunneled(level, body_type):
+    """Number of bodies shot right at 120px per tick from before a one block thick wall that end after it."""
+
+    size = level.DEFAULT_BLOCK_SIZE
+    width, height = level.size
+    count = 0
+    for y in range(height):
+        for x in range(width - 2):
+            if level.get_block((x, y)).solid or not level.get_block((x + 1, y)).solid \
+                    or level.get_block((x + 2, y)).solid:
+                continue
+            body = move(level, body_type, (x * size + 2, y * size + 4, 20, 20), (120, 0))
+            count += body.shape.right > (x + 1) * size
+    return count
+
+
+@click.command()
+@click.option("--level", "num", default=0, help="Level whose thin walls are shot at.")
+def main(num):
+    """Check where swept bodies stop, and count the walls the bodies go through with and without it."""
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    logging.basicConfig(level=logging.WARNING)
+    pygame.init()
+    # the blocks load their images when they are created
+    pygame.display.set_mode((1, 1))
+
+    failed = 0
+    for name, lines, rect, velocity, (edge, expected), cells in CASES:
+        level = make_level(lines)
+        body = move(level, SweptBody, rect, velocity)
+        stop = getattr(body.shape, edge)
+        touched = sorted(tuple(map(int, level.world_to_map(collision.shape.topleft)))
+                         for collision in body.collisions)
+        ok = stop == expected and touched == cells
+        failed += not ok
+        click.echo(f"{name:>24}: {edge} {stop:g} (expected {expected}), collides with {touched} "
+                   f"(expected {cells}) {'ok' if ok else 'WRONG'}")
+
+    level = Level.load_num(num)
+    click.echo(f"Walls of level {num} gone through at 120px per tick: {tunneled(level, Body)} by bodies, "
+               f"{tunneled(level, SweptBody)} by swept bodies")
+
+    pygame.quit()
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Memory used by the levels: the grid of blocks and the whole parsed level.
+
+The grid is compared to the layout it replaced: a list of lines of Block instances,
+one per cell, each with a __dict__.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.memory
+"""
+import os
+import json
+import logging
+import tracemalloc
+import click
+import pygame
+
+from config import LEVELS
+from constants import MAPS_FOLDER
+from level import Level
+
+
+def allocated(function):
+    """Return the result of function() and the number of bytes it allocated that are still alive."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+class LegacyBlock:
+    """A block like they were before the slots and the flyweights, with only their instance attributes."""
+
+    def __init__(self, pos=(0, 0)):
+        self.pos = pos
+        self.exploded = False
+        self.explode_frame = 1
+
+
+def make_legacy_grid(lines):
+    return [[LegacyBlock((x, y)) for x, _ in enumerate(line)] for y, line in enumerate(lines)]
+
+
+def make_grid(lines):
+    level = Level()
+    level.size = max(map(len, lines)), len(lines)
+    level.set_blocks(lines)
+    return level.grid, level.stateful_blocks
+
+
+@click.command()
+@click.option("--width", default=4000, help="Width of the big editor map to measure.")
+@click.option("--height", default=200, help="Height of the big editor map to measure.")
+def main(width, height):
+    """Report the bytes used by the grid (before and now) and the parsed level of each map, and a big editor map."""
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    logging.basicConfig(level=logging.WARNING)
+    pygame.init()
+    # the objects load their images when they are created
+    pygame.display.set_mode((1, 1))
+
+    click.echo(f"{'map':>12} {'blocks':>7} {'old kB':>8} {'grid kB':>8} {'old B/b':>8} {'B/block':>8} "
+               f"{'level kB':>9}")
+    maps = [(num, os.path.join(MAPS_FOLDER, LEVELS[num][0])) for num in sorted(LEVELS, key=int)]
+    for num, path in maps:
+        with open(path) as f:
+            lines = json.load(f)["blocks"]
+        _, old_bytes = allocated(lambda: make_legacy_grid(lines))
+        grid, grid_bytes = allocated(lambda: make_grid(lines))
+        _, level_bytes = allocated(lambda: Level.parse(path, int(num)))
+        blocks = len(lines) * max(map(len, lines))
+        click.echo(f"{'level ' + num:>12} {blocks:>7} {old_bytes / 1024:>8.0f} {grid_bytes / 1024:>8.0f} "
+                   f"{old_bytes / blocks:>8.1f} {grid_bytes / blocks:>8.1f} {level_bytes / 1024:>9.0f}")
+
+    # a map being drawn in the editor: half of it is air, the ground is dirt
+    lines = ["." * width] * (height // 2) + ["D" * width] * (height - height // 2)
+    _, old_bytes = allocated(lambda: make_legacy_grid(lines))
+    grid, grid_bytes = allocated(lambda: make_grid(lines))
+    blocks = width * height
+    click.echo(f"{f'{width}x{height}':>12} {blocks:>7} {old_bytes / 1024:>8.0f} {grid_bytes / 1024:>8.0f} "
+               f"{old_bytes / blocks:>8.1f} {grid_bytes / blocks:>8.1f} {'':>9}")
+
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Cost of each operation of physics.Pos, compared to the pure Python Pos it replaced.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.pos
+"""
+import timeit
+from math import cos, sin, pi, sqrt
+import click
+
+from physics import Pos
+
+
+class LegacyPos:
+    """The previous Pos, in pure Python, with only what is measured here."""
+
+    def __init__(self, *args):
+        if len(args) == 1:
+            args = args[0]
+        self.x = args[0]
+        self.y = args[1]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __getitem__(self, item):
+        if item == 0:
+            return self.x
+        elif item == 1:
+            return self.y
+        raise IndexError(f"Pos has no item {item}")
+
+    def __add__(self, other):
+        return LegacyPos(self[0] + other[0], self[1] + other[1])
+
+    def __sub__(self, other):
+        return LegacyPos(self[0] - other[0], self[1] - other[1])
+
+    def __mul__(self, other):
+        return LegacyPos(self[0] * other, self[1] * other)
+
+    def __rmul__(self, other):
+        return LegacyPos(self.x * other, self.y * other)
+
+    def __truediv__(self, other: float):
+        return LegacyPos(self[0] / other, self[1] / other)
+
+    @property
+    def t(self):
+        return self[0], self[1]
+
+    def norm(self):
+        return sqrt(self[0] ** 2 + self[1] ** 2)
+
+    def rotate(self, degree):
+        c = cos(pi / 180 * degree)
+        s = sin(pi / 180 * degree)
+        return LegacyPos(c * self[0] + s * self[1],
+                         s * self[0] - c * self[1])
+
+
+OPERATIONS = {
+    "create": "P(3.5, 4.5)",
+    "copy": "P(a)",
+    "a + b": "a + b",
+    "a + tuple": "a + (1, 2)",
+    "a - b": "a - b",
+    "k * a": "0.5 * a",
+    "a / k": "a / 2",
+    "a += b": "c += b",
+    "a[0]": "a[0]",
+    "a.x": "a.x",
+    "a.t": "a.t",
+    "norm": "a.norm()",
+    "rotate": "a.rotate(30)",
+    "friction": "c += b - 0.1 * c",  # as in the integrators
+}
+
+
+@click.command()
+@click.option("--number", default=200_000, help="Number of times each operation is timed.")
+def main(number):
+    """Time each operation of the vectors, in nanoseconds."""
+
+    click.echo(f"{'operation':<10} {'legacy ns':>10} {'Pos ns':>8} {'speedup':>8}")
+    for name, statement in OPERATIONS.items():
+        times = []
+        for cls in (LegacyPos, Pos):
+            env = {"P": cls, "a": cls(3.5, 4.5), "b": cls(1.25, -2)}
+            timer = timeit.Timer(statement, setup="c = P(0, 0)", globals=env)
+            times.append(min(timer.repeat(repeat=3, number=number)) / number * 1e9)
+        click.echo(f"{name:<10} {times[0]:>10.0f} {times[1]:>8.0f} {times[0] / times[1]:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 import os
-import re
 import random
 import time
 from functools import partial, lru_cache
@@ -11,6 +10,7 @@ from config import get_lava_sheets
 from entities import Brochette
 from helper import classproperty
 from physics import Pos
+from sprites import SPRITES
 
 LOGGER = logging.getLogger(__name__)
 
@@ -23,28 +23,42 @@ def get_boom_img(i):
     return img
 
 
-def re_compile(matrix):
-    """Compile the matrix of pattern and replace the " " by dots to match the air."""
-    not_solid = "".join([b().character for b in BLOCKS if not b().solid]) + Block.character + EndBlock.character
-    solid = "".join([b().character for b in BLOCKS if b().solid and b is not EndBlock])
-    not_solid = f"[{re.escape(not_solid)}]"
-    solid = f"[{re.escape(solid)}]"
+# Neighbours of a block, in the order of the bits of its autotiling mask
+NEIGHBOURS = [(dx, dy) for dy in range(-1, 2) for dx in range(-1, 2) if dx or dy]
 
-    compiled = []
-    for line in matrix:
-        compiled_line = []
-        for pattern in line:
-            pattern = pattern.replace(" ", not_solid)
-            pattern = pattern.replace("?", solid)
-            pattern = re.compile(pattern)
-            compiled_line.append(pattern)
-        compiled.append(compiled_line)
-    return compiled
+
+def compile_patterns(matrix, default):
+    """
+    Compile the matrix of patterns into the sheet position to use for each of the 256 neighbour masks.
+
+    A pattern is a string of the 9 blocks around (and including) the tile, line by line.
+    "?" is any solid block, " " any non solid block and "." any block. The centre is ignored.
+    The first pattern that matches gives the sprite, the default one is used if none does.
+    """
+
+    def match(pattern, mask):
+        pattern = pattern[:4] + pattern[5:]
+        for bit, char in enumerate(pattern):
+            solid = mask >> bit & 1
+            if char == "?" and not solid or char == " " and solid:
+                return False
+        return True
+
+    lookup = []
+    for mask in range(256):
+        for y, line in enumerate(matrix):
+            matching = [x for x, pattern in enumerate(line) if match(pattern, mask)]
+            if matching:
+                lookup.append((matching[0], y))
+                break
+        else:
+            lookup.append(default)
+    return lookup
 
 
 class Block:
     DEFAULT_BLOCK_SIZE = DEFAULT_BLOCK_SIZE
-    IGNORE_IMG_CACHE = False
+    IGNORE_IMG_CACHE = False  # Animated blocks, they can't be pre-rendered
 
     character = '.'
     _sheet = None
@@ -55,77 +69,82 @@ class Block:
     deadly = False
     rotation = 0
     sheet_pattern = [[]]
+    autotile_solid = False  # Whether it is a "?" for the sheet_pattern of its neighbours
+    stateful = False  # Whether it changes during the game
+
+    # a level has a block per cell, they are kept small. The subclasses with more state have a __dict__
+    __slots__ = ("pos",)
 
     def __init__(self, pos=(0, 0)):
         self.pos = pos
-        self.exploded = False
-        self.explode_frame = 1
 
     @staticmethod
     def new(character='.', pos=(0, 0)):
-        dic = {
-            "D": Dirt,
-            "S": Stone,
-            "H": Bush,
-            "F": Cloud,
-            "C": CatCloud,
-            "L": Lava,
-            "B": Barbecue,
-            "E": EndBlock,
-            "V": partial(FieryBarbecue, "V"),
-            "^": partial(FieryBarbecue, "^"),
-            "<": partial(FieryBarbecue, "<"),
-            ">": partial(FieryBarbecue, ">")
-        }
-
-        return dic.get(character, Block)(pos)
-
-    def get_img(self, neighbourg="", rotation=0):
-        """Neighbourg is a string of nine chars of the 9 blocks next to this one."""
-
-        for y, line in enumerate(self.sheet_pattern):
-            for x, pattern in enumerate(line):
-                if pattern.match(neighbourg):
-                    return self.img_at(x, y, rotation)
-
-        return self.img_at(*self.default_sprite_pos, rotation=rotation)
-
-    def explode(self):
-        self.exploded = True
+        return BLOCK_TYPES.get(character, Block)(pos)
+
+    @classproperty
+    @lru_cache()
+    def sheet_lookup(cls):
+        """The position in the sheet of the sprite for each neighbour mask."""
+        return compile_patterns(cls.sheet_pattern, cls.default_sprite_pos)
+
+    def get_img(self, mask=None, rotation=0):
+        """
+        Get the image of the block given which of its neighbours are solid.
+
+        The mask has the bit i set if the i-th block of NEIGHBOURS is autotile_solid.
+        """
+
+        if mask is None:
+            x, y = self.default_sprite_pos
+        else:
+            x, y = self.sheet_lookup[mask]
+        return self.img_at(x, y, rotation, self.current_frame())
 
     @classmethod
-    # @lru_cache()
-    def img_at(cls, x, y, rotation=0):
-        return pygame.transform.rotate(cls.sheet.subsurface((x * cls.DEFAULT_BLOCK_SIZE, y * cls.DEFAULT_BLOCK_SIZE,
-                                                             cls.DEFAULT_BLOCK_SIZE, cls.DEFAULT_BLOCK_SIZE)), rotation)
+    def current_frame(cls):
+        """Index of the animation frame to display now."""
+        return 0
+
+    @classmethod
+    def get_sheet(cls, frame=0):
+        return cls.sheet
+
+    @classmethod
+    def img_at(cls, x, y, rotation=0, frame=0):
+        def make_img():
+            size = cls.DEFAULT_BLOCK_SIZE
+            rect = (x * size, y * size, size, size)
+            return pygame.transform.rotate(cls.get_sheet(frame).subsurface(rect), rotation)
+
+        return SPRITES.get((cls, (x, y), rotation, frame), make_img)
 
     def internal_logic(self, level):
-        pass
+        """Called by the level when the stateful block's next_spawn countdown ends, see Level.wake_blocks."""
 
     def on_collision(self, level):
         pass
 
 
 class Dirt(Block):
+    __slots__ = ()
     character = "D"
     solid = True
     visible = True
     deadly = False
+    autotile_solid = True
     default_sprite_pos = 1, 1
 
-    @classproperty
-    @lru_cache()
-    def sheet_pattern(cls):
-        # . is any block
-        # ? is any solid
-        # " " is any non solid block
-        return re_compile([
-            [". . ??.?.", ". .??????", ". .?? .?.", ". . ? .?.", "???????? ", "?????? ??"],
-            [".?. ??.?.", "?????????", ".?.?? .?.", ".?. ? .?.", ".? .?????", " ?.??.???"],
-            [".?? ??. .", ".?.???. .", "??.?? . .", ".?. ? . .", ". . ??.? ", ". .??  ?."],
-            [". . ??. .", ". .???. .", ". .?? . .", ". . ? . .", ".?  ??. .", " ?.?? . ."],
-            [". .??? ??", ". .??? ? ", ". .????? ", ".?. ?? ? ", ".?.??  ? "]
-        ])
+    # . is any block
+    # ? is any solid
+    # " " is any non solid block
+    sheet_pattern = [
+        [". . ??.?.", ". .??????", ". .?? .?.", ". . ? .?.", "???????? ", "?????? ??"],
+        [".?. ??.?.", "?????????", ".?.?? .?.", ".?. ? .?.", ".? .?????", " ?.??.???"],
+        [".?? ??. .", ".?.???. .", "??.?? . .", ".?. ? . .", ". . ??.? ", ". .??  ?."],
+        [". . ??. .", ". .???. .", ". .?? . .", ". . ? . .", ".?  ??. .", " ?.?? . ."],
+        [". .??? ??", ". .??? ? ", ". .????? ", ".?. ?? ? ", ".?.??  ? "]
+    ]
 
     @classproperty
     def sheet(cls):
@@ -139,10 +158,12 @@ class Dirt(Block):
 
 
 class Stone(Block):
+    __slots__ = ()
     character = "S"
     solid = True
     visible = True
     deadly = False
+    autotile_solid = True
     default_sprite_pos = 1, 1
 
     @classproperty
@@ -155,18 +176,16 @@ class Stone(Block):
             cls._sheet = sheet
         return cls._sheet
 
-    @classproperty
-    @lru_cache()
-    def sheet_pattern(cls):
-        return re_compile([
-            [". . ??.?.", ". .??????", ". .?? .?.", ". . ? .?."],  # "???.??.? ", "?????. ?."],
-            [".?. ??.?.", "?????????", ".?.?? .?.", ".?. ? .?."],  # ".? .?????", " ?.??.???"],
-            [".?. ??. .", ".?.???. .", ".?.?? . .", ".?. ? . ."],  # ". . ??.? ", ". .??  ?."],
-            [". . ??. .", ". .???. .", ". .?? . .", ". . ? . ."],  # ".?  ??. .", " ?.?? . ."]
-        ])
+    sheet_pattern = [
+        [". . ??.?.", ". .??????", ". .?? .?.", ". . ? .?."],  # "???.??.? ", "?????. ?."],
+        [".?. ??.?.", "?????????", ".?.?? .?.", ".?. ? .?."],  # ".? .?????", " ?.??.???"],
+        [".?. ??. .", ".?.???. .", ".?.?? . .", ".?. ? . ."],  # ". . ??.? ", ". .??  ?."],
+        [". . ??. .", ". .???. .", ". .?? . .", ". . ? . ."],  # ".?  ??. .", " ?.?? . ."]
+    ]
 
 
 class Bush(Block):
+    __slots__ = ()
     character = "H"
     solid = False
     visible = True
@@ -184,6 +203,7 @@ class Bush(Block):
 
 
 class Cloud(Block):
+    __slots__ = ()
     character = "F"
     solid = False
     visible = True
@@ -201,6 +221,7 @@ class Cloud(Block):
 
 
 class CatCloud(Block):
+    __slots__ = ()
     character = "C"
     solid = False
     visible = True
@@ -218,15 +239,16 @@ class CatCloud(Block):
 
 
 class Lava(Block):
+    __slots__ = ()
     character = "L"
     solid = True
     visible = True
     deadly = True
-    current_index = 0
+    autotile_solid = True
     IGNORE_IMG_CACHE = True
 
     @classproperty
-    def sheet(cls):
+    def sheets(cls):
         if cls._sheet is None:
             sheets = [pygame.image.load(os.path.join(os.path.join(LEVELS_GRAPHICAL_FOLDER, "lava"),
                                                      path.lower())).convert()
@@ -235,15 +257,28 @@ class Lava(Block):
             for i in range(len(sheets)):
                 sheets[i] = pygame.transform.scale(sheets[i], (DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE))
             cls._sheet = sheets
-        cls.current_index = (time.time() * 15) % len(cls._sheet)
-        return cls._sheet[int(cls.current_index)]
+        return cls._sheet
+
+    @classproperty
+    def sheet(cls):
+        return cls.sheets[cls.current_frame()]
+
+    @classmethod
+    def current_frame(cls):
+        return int(time.time() * 15) % len(cls.sheets)
+
+    @classmethod
+    def get_sheet(cls, frame=0):
+        return cls.sheets[frame]
 
 
 class Barbecue(Block):
+    __slots__ = ()
     character = "B"
     solid = True
     visible = True
     deadly = True
+    autotile_solid = True
 
     @classproperty
     def sheet(cls):
@@ -261,6 +296,8 @@ class FieryBarbecue(Block):
     solid = False
     visible = True
     deadly = True
+    stateful = True
+    PERIOD = 75  # ticks between two brochettes
 
     char_dic = {
         "^": (0, Pos(0, -1)),  # Rotation and direction of brochettes
@@ -283,18 +320,34 @@ class FieryBarbecue(Block):
         super().__init__(pos)
         self.character = character
         self.rotation = FieryBarbecue.char_dic[self.character][0]
-        self.next_spawn = 15
-        self.brochettes = []
+        self.next_spawn = 15  # ticks before the next brochette, counting the current one
+
+    def spawn_pos(self, level):
+        return level.map_to_world(self.pos) + Pos(DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE) / 2
 
     def internal_logic(self, level):
-        self.next_spawn -= 1
-        if self.next_spawn <= 0:
-            level.spawn(Brochette(level.map_to_world(self.pos) + Pos(DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE) / 2,
-                                  FieryBarbecue.char_dic[self.character]))
-            self.next_spawn = 75
+        Brochette.spawn(level.brochettes, self.spawn_pos(level), FieryBarbecue.char_dic[self.character])
+        self.next_spawn = self.PERIOD
+
+    def catch_up(self, level, due):
+        """
+        Spawn the brochettes shot since the tick due while nobody looked, return the tick of the next one.
+
+        They are added as they would be now, the ones that already disappeared are skipped.
+        """
+
+        physics = FieryBarbecue.char_dic[self.character]
+        lifetime = Brochette.lifetime(level.brochettes, self.spawn_pos(level), physics)
+        first = due
+        if lifetime is not None and level.tick - lifetime + 1 > due:
+            first -= (due - level.tick + lifetime - 1) // self.PERIOD * self.PERIOD
+        for tick in range(first, level.tick, self.PERIOD):
+            Brochette.spawn(level.brochettes, self.spawn_pos(level), physics, level.tick - tick)
+        return due - (due - level.tick) // self.PERIOD * self.PERIOD
 
 
 class EndBlock(Block):
+    __slots__ = ()
     character = "E"
     solid = True
     visible = True
@@ -329,3 +382,26 @@ BLOCKS = [
     partial(FieryBarbecue, "V"),
     EndBlock,
 ]
+
+BLOCK_TYPES = {
+    "D": Dirt,
+    "S": Stone,
+    "H": Bush,
+    "F": Cloud,
+    "C": CatCloud,
+    "L": Lava,
+    "B": Barbecue,
+    "E": EndBlock,
+    "V": partial(FieryBarbecue, "V"),
+    "^": partial(FieryBarbecue, "^"),
+    "<": partial(FieryBarbecue, "<"),
+    ">": partial(FieryBarbecue, ">")
+}
+
+# The grid of a level stores a code per block: its index in CHARACTERS.
+# Unknown characters are air, like Block.new does.
+CHARACTERS = "." + "".join(BLOCK_TYPES)
+CODES = {character: code for code, character in enumerate(CHARACTERS)}
+# One block of each kind shared by all the cells with this code. They have no position,
+# only the stateful blocks (see Block.stateful) need an instance per cell.
+FLYWEIGHTS = [Block.new(character, None) for character in CHARACTERS]
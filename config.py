@@ -79,6 +79,12 @@ class Config(configlib.Config):
 
     send_log = False
 
+    record_replays = False  # save the inputs of each finished level in the replays folder, see replay.py
+
+    vsync = False  # wait for the refresh of the screen to show the frames, see pacer.py
+
+    threaded_simulation = False  # run the ticks on their own thread, see SimulationThread
+
     first_time_launch = True
 
     def __setitem__(self, key, value):
@@ -24,11 +24,15 @@ LEVELS_FOLDER = os.path.join(ASSETS, 'levels')
 LEVELS_GRAPHICAL_FOLDER = os.path.join(LEVELS_FOLDER, 'graphical')
 MAPS_FOLDER = os.path.join(LEVELS_FOLDER, 'maps')
 KEYS_FOLDER = os.path.join(ASSETS, 'keys')
+REPLAYS_FOLDER = os.path.join(ASSETS, 'replays')
 
 # Blocks
 DEFAULT_BLOCK_SIZE = 32
 START = "P"
 
+# Sprites
+SPRITE_CACHE_BUDGET = 8 * 2 ** 20  # bytes
+
 # Physical constant
 BROCHETTE_VELOCITY = 15
 
@@ -1,6 +1,7 @@
 import os
 import random
 from functools import lru_cache
+import numpy as np
 import pygame
 from graphalama.colors import mix
 import logging
@@ -8,7 +9,7 @@ import logging
 from constants import LEVELS_GRAPHICAL_FOLDER, DEFAULT_BLOCK_SIZE, BROCHETTE_VELOCITY, FRAME_BEFORE_DESPAWN
 from config import get_available_blocks
 from helper import classproperty
-from physics import AABB, Pos, Projectile, CollisionType
+from physics import AABB, Pos, Projectile, ProjectileView, Layer
 
 LOGGER = logging.getLogger(__name__)
 
@@ -94,10 +95,15 @@ class AK47(Object, Projectile):
         surf.blit(self.img, self.topleft + offset)
 
 
-class Brochette(Projectile):
+class Brochette(ProjectileView):
+    """The brochettes live in the ProjectileArray of the level, this is how bodies see them."""
+
     deadly = True
+    layer = Layer.DEADLY
     _img = None
 
+    __slots__ = ()
+
     @classproperty
     def img(cls):
         if cls._img is None:
@@ -112,83 +118,120 @@ class Brochette(Projectile):
     @classmethod
     @lru_cache()
     def get_image(cls, rot, alpha, variant):
-        img = pygame.transform.rotate(variant, rot)
+        img = pygame.transform.rotate(cls.img[variant], rot)
         img.set_colorkey((255, 0, 255))
         img.set_alpha(round(alpha))
         return img
 
-    def __init__(self, start_pos, physics=(0, Pos(0, 0))):
-
+    @staticmethod
+    def hitbox(physics=(0, Pos(0, 0))):
         if abs(physics[0]) == 90:  # horizontal
-            hitbox = Pos(DEFAULT_BLOCK_SIZE - 2,
-                      DEFAULT_BLOCK_SIZE * 14 / 32)
+            return Pos(DEFAULT_BLOCK_SIZE - 2,
+                       DEFAULT_BLOCK_SIZE * 14 / 32)
         else:  # vertical
-            hitbox = Pos(DEFAULT_BLOCK_SIZE * 14 / 32,
-                      DEFAULT_BLOCK_SIZE - 2)
+            return Pos(DEFAULT_BLOCK_SIZE * 14 / 32,
+                       DEFAULT_BLOCK_SIZE - 2)
 
-        shape = AABB(start_pos - hitbox / 2, hitbox)
+    @classmethod
+    def lifetime(cls, array, start_pos, physics=(0, Pos(0, 0))):
+        """Number of ticks a brochette spawned there stays in the array, None if forever."""
 
-        super().__init__(shape, mass=0)
+        hitbox = cls.hitbox(physics)
+        return array.lifetime(tuple(start_pos - hitbox / 2), tuple(hitbox), tuple(physics[1] * BROCHETTE_VELOCITY))
 
-        self.velocity = physics[1] * BROCHETTE_VELOCITY
-        self.rotation = physics[0] - 90
-        self.variant = random.choice(self.img)
-        self.ttl = FRAME_BEFORE_DESPAWN
+    @classmethod
+    def spawn(cls, array, start_pos, physics=(0, Pos(0, 0)), age=0):
+        """Add a brochette centered on start_pos to the array, age ticks after. Physics is (angle, direction)."""
+
+        hitbox = cls.hitbox(physics)
+        array.add(start_pos - hitbox / 2, hitbox, physics[1] * BROCHETTE_VELOCITY,
+                  physics[0] - 90, random.randrange(len(cls.img)), age)
 
     def render(self, surf, offset=(0, 0)):
         image = self.get_image(self.rotation, 255 * self.ttl / FRAME_BEFORE_DESPAWN, self.variant)
         surf.blit(image, self.shape.topleft + offset)
 
-    def internal_logic(self):
-        for colli in self.collisions:
-            if colli.type == CollisionType.BLOCK and not self.sleep:
-                self.sleep = True
 
-        if self.sleep:
+class Particles:
+    """
+    Particles that share their physics and look, stored in numpy arrays and moved all at once.
 
-            self.ttl -= 1
-            if self.ttl <= 0:
-                self.dead = True
+    Each one has a constant acceleration and a friction, and its color goes from color to
+    color_shift during its life. The sprite for each age is made once, so drawing
+    them all is a single blits call.
+    """
 
+    FIELDS = ("pos", "velocity", "age")
 
-class Particle:
-    def __init__(self, pos, velocity=(0, 0), acceleration=(0, 1), friction=0.1, life_time: int=60, size=3,
-                 color=(255, 165, 0), color_shift=(80, 00, 0)):
-        """Create a particle with a constant acceleration"""
-        self.pos = Pos(pos)
-        self.velocity = Pos(velocity)
-        self.acceleration = Pos(acceleration)
+    def __init__(self, acceleration=(0, 1), friction=0.1, life_time: int=60, size=3,
+                 color=(255, 165, 0), color_shift=(80, 00, 0), capacity=256):
+        self.acceleration = np.array(acceleration, dtype=float)
         self.friction = friction
         self.life_time = life_time
-        self.age = 0
+        self.size = size
         self.color = color
         self.color_shift = color_shift
-        self.size = size
-        self.dead = False
-
-    def internal_logic(self):
-        self.velocity += self.acceleration - self.friction * self.velocity
-        self.pos += self.velocity
-        self.age += 1
-        if self.age > self.life_time:
-            self.dead = True
+        self._sprites = None
+
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.age = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def sprites(self):
+        """The image of a particle for each age."""
+        if self._sprites is None:
+            self._sprites = []
+            for age in range(self.life_time + 1):
+                img = pygame.Surface((self.size, self.size))
+                img.fill(mix(self.color, self.color_shift, 1 - age / self.life_time))
+                self._sprites.append(img)
+        return self._sprites
+
+    def add(self, pos, velocity=(0, 0)):
+        if self.count == len(self.pos):
+            for name in self.FIELDS:
+                old = getattr(self, name)
+                new = np.zeros((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+                new[:self.count] = old[:self.count]
+                setattr(self, name, new)
+
+        i = self.count
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.age[i] = 0
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def simulate(self, bottom=None):
+        """Move all the particles of one tick. The old ones disappear, and the ones below bottom if given."""
+
+        n = self.count
+        velocity = self.velocity[:n]
+        velocity += self.acceleration - self.friction * velocity
+        self.pos[:n] += velocity
+        self.age[:n] += 1
+
+        alive = self.age[:n] <= self.life_time
+        if bottom is not None:
+            alive &= self.pos[:n, 1] < bottom
+        if not alive.all():
+            kept = int(alive.sum())
+            for name in self.FIELDS:
+                array = getattr(self, name)
+                array[:kept] = array[:n][alive]
+            self.count = kept
 
     def render(self, surf: pygame.Surface):
-        life_prop = 1 - self.age / self.life_time
-        color = mix(self.color, self.color_shift, life_prop)
-
-        rect = (self.pos, (self.size, self.size))
-        surf.fill(color, rect)
-
-        # img = self.get_img_surf(self.size, color, 255 * life_prop)
-        # surf.blit(img, self.pos)
-
-    @lru_cache()
-    def get_img_surf(self, size, color, alpha):
-        img = pygame.Surface((size, size))
-        img.fill(color)
-        # img.set_alpha(round(alpha))
-        return img
+        sprites = self.sprites
+        surf.blits(zip([sprites[age] for age in self.age[:self.count].tolist()], self.pos[:self.count].tolist()),
+                   doreturn=False)
 
 
 OBJECTS = {
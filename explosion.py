@@ -0,0 +1,145 @@
+"""
+The explosion at the end of a level: the blocks on screen blow up a few at a time, in a random order.
+
+Everything moves in the logic ticks, the rendering only draws the current state.
+"""
+import random
+import logging
+from collections import deque
+from functools import lru_cache
+from math import ceil
+import numpy as np
+import pygame
+
+from blocks import FLYWEIGHTS, get_boom_img
+from config import CONFIG
+from constants import DEFAULT_BLOCK_SIZE
+from entities import Particles
+from physics import Pos
+
+LOGGER = logging.getLogger(__name__)
+
+COLORKEY = (255, 0, 255)
+VISIBLE = np.zeros(256, dtype=bool)
+VISIBLE[:len(FLYWEIGHTS)] = [block.visible for block in FLYWEIGHTS]
+
+
+@lru_cache()
+def get_boom_atlas():
+    """All the frames of the boom animation side by side in one surface, and the area of each frame."""
+
+    frames = [get_boom_img(i) for i in range(1, Explosion.FRAMES + 1)]
+    width, height = frames[0].get_size()
+    atlas = pygame.Surface((width * len(frames), height)).convert()
+    atlas.fill((0, 0, 0))
+    for i, frame in enumerate(frames):
+        atlas.blit(frame, (i * width, 0))
+    atlas.set_colorkey((0, 0, 0), pygame.RLEACCEL)  # it never changes, and is mostly transparent
+    return atlas, [pygame.Rect(i * width, 0, width, height) for i in range(len(frames))]
+
+
+class Explosion:
+    BLOCKS_PER_TICK = 5
+    PARTICLES_PER_BLOCK = 5
+    FRAMES = 15  # of the boom animation
+    TICKS_PER_FRAME = 3
+    BLAST_FRAMES = 4  # the block is still drawn during the first frames of its boom
+    BOOM_OFFSET = (-16, -16)  # of the boom image, from the block
+    SHAKE = 5  # pixels
+
+    def __init__(self, level):
+        self.num = level.num
+        self.bottom = level.screen_size[1]
+        self.tick = 0
+        self.over = False
+        self.shake = (0, 0)
+        self.particles = Particles(size=6)
+
+        # The blocks inside the screen, taken from the grid in one slice
+        size = DEFAULT_BLOCK_SIZE
+        width, height = level.size
+        left, top = level.offset
+        start_x, end_x = (min(max(ceil(x / size), 0), width) for x in (left, left + level.screen_size[0]))
+        start_y, end_y = (min(max(ceil(y / size), 0), height) for y in (top, top + level.screen_size[1]))
+        grid = np.frombuffer(level.grid, dtype=np.uint8).reshape(height + 2, width + 2)
+        ys, xs = np.nonzero(VISIBLE[grid[1 + start_y:1 + end_y, 1 + start_x:1 + end_x]])
+        cells = list(zip((xs + start_x).tolist(), (ys + start_y).tolist()))
+
+        # the ones that do not move are drawn once in a surface, erased from it as they explode
+        self.origin = level.map_to_display((start_x, start_y)) // 1
+        self.still = pygame.Surface((max(end_x - start_x, 0) * size, max(end_y - start_y, 0) * size))
+        self.still.fill(COLORKEY)
+        self.still.set_colorkey(COLORKEY)
+        self.animated = {}  # map position -> display position, for the animated blocks not exploded yet
+        self.images = {}  # map position -> image, to draw a block during its blast
+        self.display = {}  # map position -> display position
+        for pos in cells:
+            self.images[pos] = level.get_img_at(pos)
+            self.display[pos] = level.map_to_display(pos)
+            if level.get_block(pos).IGNORE_IMG_CACHE:
+                self.animated[pos] = self.display[pos]
+            else:
+                self.still.blit(self.images[pos], ((pos[0] - start_x) * size, (pos[1] - start_y) * size))
+        self.start = start_x, start_y
+        self.level = level
+
+        self.shared = False  # whether still is drawn from another thread, see share
+        self.queue = cells
+        random.shuffle(self.queue)
+        self.booms = deque()  # (tick when it exploded, map position), oldest first
+        LOGGER.info(f"We're going to explode {len(self.queue)} blocks")
+
+    @property
+    def duration(self):
+        """Ticks a boom lasts."""
+        return self.FRAMES * self.TICKS_PER_FRAME
+
+    def share(self):
+        """The still surface is drawn from another thread from now on: the next blocks are erased from a copy."""
+        self.shared = True
+
+    def logic(self):
+        """Advance the explosion of one tick."""
+
+        self.particles.simulate(bottom=self.bottom)
+        if self.shared and self.queue:
+            self.still = self.still.copy()
+            self.shared = False
+
+        while self.booms and self.tick - self.booms[0][0] >= self.duration:
+            self.booms.popleft()
+
+        size = DEFAULT_BLOCK_SIZE
+        for _ in range(min(self.BLOCKS_PER_TICK, len(self.queue))):
+            pos = self.queue.pop()
+            self.booms.append((self.tick, pos))
+            if self.animated.pop(pos, None) is None:
+                self.still.fill(COLORKEY, ((pos[0] - self.start[0]) * size, (pos[1] - self.start[1]) * size,
+                                           size, size))
+            for _ in range(self.PARTICLES_PER_BLOCK):
+                angle = random.randint(0, 360)
+                self.particles.add(self.display[pos], 25 * Pos.unit_y().rotate(angle))
+            CONFIG.levels_stats[str(self.num)][3] += 1
+
+        self.shake = random.randint(-self.SHAKE, self.SHAKE + 1), random.randint(-self.SHAKE, self.SHAKE + 1)
+        self.tick += 1
+        self.over = not self.queue and not self.booms and not self.particles
+
+    def render(self, surf):
+        surf.blit(self.still, self.origin)
+        surf.blits([(self.level.get_img_at(pos), display_pos) for pos, display_pos in self.animated.items()],
+                   doreturn=False)
+
+        atlas, areas = get_boom_atlas()
+        blasts = []
+        booms = []
+        for start, pos in self.booms:
+            frame = (self.tick - 1 - start) // self.TICKS_PER_FRAME
+            if frame < self.BLAST_FRAMES:
+                blasts.append((self.images[pos], self.display[pos]))
+            booms.append((atlas, self.display[pos] + self.BOOM_OFFSET, areas[frame]))
+        surf.blits(blasts, doreturn=False)
+        surf.blits(booms, doreturn=False)
+
+        self.particles.render(surf)
+        surf.scroll(*self.shake)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Play levels without a window, as fast as possible, to measure the game logic.
+
+The player is driven by a script, a text file with one input per line:
+
+    # tick binding down/up
+    0 right down
+    40 jump down
+    60 jump up
+
+Without script, the player runs right and jumps regularly.
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import logging
+import random
+from contextlib import nullcontext
+from time import perf_counter
+import click
+import pygame
+
+from config import CONFIG, LEVELS
+from level import Level
+from physics import POOLS
+from simulation import Simulation
+
+SCREEN_SIZE = (1600, 1008)
+BINDINGS = ("left", "right", "jump", "run")
+
+
+def default_script(ticks):
+    """Run right and jump every 40 ticks."""
+    script = [(0, "right", True), (0, "run", True)]
+    for tick in range(0, ticks, 40):
+        script.append((tick, "jump", True))
+        script.append((tick + 20, "jump", False))
+    return script
+
+
+def load_script(path):
+    script = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            tick, binding, state = line.split()
+            if binding not in BINDINGS or state not in ("down", "up"):
+                raise click.BadParameter(f"Invalid input line: {line}", param_hint="script")
+            script.append((int(tick), binding, state == "down"))
+    return sorted(script, key=lambda i: i[0])
+
+
+def script_events(script):
+    """Map each tick to the pygame events the player receives before it."""
+    events = {}
+    for tick, binding, pressed in script:
+        event = pygame.event.Event(pygame.KEYDOWN if pressed else pygame.KEYUP,
+                                   key=getattr(CONFIG.bindings, binding))
+        events.setdefault(tick, []).append(event)
+    return events
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def run(num, ticks, script):
+    """Play the level for the given number of ticks and return the measures."""
+
+    start = perf_counter()
+    level = Level.load_num(num)
+    load_time = perf_counter() - start
+
+    start = perf_counter()
+    Level.load_num(num)
+    reload_time = perf_counter() - start
+
+    simulation = Simulation(level, SCREEN_SIZE)
+    events = script_events(script)
+    latencies = []
+    start = perf_counter()
+    for tick in range(ticks):
+        for event in events.get(tick, ()):
+            simulation.update(event)
+
+        tick_start = perf_counter()
+        simulation.step()
+        latencies.append(perf_counter() - tick_start)
+
+        if simulation.level.over:
+            break
+    total = perf_counter() - start
+
+    latencies.sort()
+    return {
+        "level": num,
+        "ticks": len(latencies),
+        "deaths": simulation.deaths,
+        "load_ms": load_time * 1000,
+        "reload_ms": reload_time * 1000,
+        "ticks_per_s": len(latencies) / total,
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p90_us": percentile(latencies, 90) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+        "max_us": latencies[-1] * 1e6,
+    }
+
+
+@click.command()
+@click.argument("levels", nargs=-1, type=click.Choice(sorted(LEVELS, key=int)))
+@click.option("--ticks", default=3600, help="Number of ticks to simulate per level (60 per second of game).")
+@click.option("--script", type=click.Path(exists=True, dir_okay=False), help="File of scripted inputs.")
+@click.option("--seed", default=0, help="Seed of the random generator.")
+@click.option("--lookups", is_flag=True, help="Count where the block lookups land (slower).")
+def main(levels, ticks, script, seed, lookups):
+    """Run the LEVELS (numbers, all of them by default) headless and report how fast the logic is."""
+
+    logging.basicConfig(level=logging.WARNING)
+    pygame.init()
+    # needed to load and convert the sprites, but nothing is shown with the dummy driver
+    pygame.display.set_mode(SCREEN_SIZE)
+
+    script = load_script(script) if script else default_script(ticks)
+    levels = levels or sorted(LEVELS, key=int)
+
+    click.echo(f"{'level':>5} {'ticks':>6} {'deaths':>6} {'load ms':>8} {'reload ms':>9} {'ticks/s':>8} "
+               f"{'p50 us':>7} {'p90 us':>7} {'p99 us':>7} {'max us':>8}")
+    with Level.counting_lookups() if lookups else nullcontext() as counts:
+        for num in levels:
+            random.seed(seed)
+            r = run(int(num), ticks, script)
+            click.echo(f"{r['level']:>5} {r['ticks']:>6} {r['deaths']:>6} {r['load_ms']:>8.2f} "
+                       f"{r['reload_ms']:>9.2f} {r['ticks_per_s']:>8.0f} {r['p50_us']:>7.0f} {r['p90_us']:>7.0f} "
+                       f"{r['p99_us']:>7.0f} {r['max_us']:>8.0f}")
+
+    for pool in POOLS:
+        click.echo(pool)
+    if lookups:
+        click.echo(f"Block lookups: {counts['map']} in the map, {counts['border']} on the border, "
+                   f"{counts['outside']} outside")
+
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -27,3 +27,80 @@ def classproperty(func):
         func = classmethod(func)
 
     return ClassPropertyDescriptor(func)
+
+
+def slots_of(cls):
+    """Names of the slots of the class and its parents."""
+    names = []
+    for klass in cls.__mro__:
+        slots = getattr(klass, "__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        names.extend(name for name in slots if name not in ("__dict__", "__weakref__"))
+    return names
+
+
+def get_state(obj):
+    """The attributes of an instance, whether they are in slots or in its __dict__."""
+    state = {name: getattr(obj, name) for name in slots_of(type(obj)) if hasattr(obj, name)}
+    state.update(getattr(obj, "__dict__", {}))
+    return state
+
+
+def set_state(obj, state):
+    for name, value in state.items():
+        setattr(obj, name, value)
+
+
+class DirtySurface:
+    """Draw on a surface like it, and record the rects that were drawn on."""
+
+    def __init__(self, surf):
+        self.surf = surf
+        self.rects = []
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        rect = self.surf.blit(source, dest, area, special_flags)
+        self.rects.append(rect)
+        return rect
+
+    def blits(self, blit_sequence, doreturn=1):
+        rects = self.surf.blits(blit_sequence, doreturn=True)
+        self.rects.extend(rects)
+        return rects if doreturn else None
+
+    def fill(self, color, rect=None, special_flags=0):
+        rect = self.surf.fill(color, rect, special_flags)
+        self.rects.append(rect)
+        return rect
+
+    def __getattr__(self, name):
+        return getattr(self.surf, name)
+
+
+class RecordingSurface:
+    """Look like a surface of the given size, but only record what is drawn on it, to draw it later with replay."""
+
+    def __init__(self, size):
+        self.size = tuple(size)
+        self.calls = []  # (method name, arguments)
+
+    def get_size(self):
+        return self.size
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        self.calls.append(("blit", (source, tuple(dest), area, special_flags)))
+
+    def blits(self, blit_sequence, doreturn=1):
+        self.calls.append(("blits", (list(blit_sequence), False)))
+
+    def fill(self, color, rect=None, special_flags=0):
+        self.calls.append(("fill", (color, rect, special_flags)))
+
+    def scroll(self, dx=0, dy=0):
+        self.calls.append(("scroll", (dx, dy)))
+
+    def replay(self, surf):
+        """Draw on surf what was drawn on the recording."""
+        for name, args in self.calls:
+            getattr(surf, name)(*args)
@@ -1,28 +1,58 @@
 import json
 import os
-import random
 import logging
-from time import time
-from typing import List
-
-from blocks import Block, Stone, get_boom_img
-from constants import MAPS_FOLDER, START
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import numpy as np
+import pygame
+
+from blocks import Block, Stone, EndBlock, NEIGHBOURS, CHARACTERS, CODES, FLYWEIGHTS
+from constants import MAPS_FOLDER, START, FRAME_BEFORE_DESPAWN
 from config import LEVELS, CONFIG
-from entities import Spawn, Object, AK47, Particle
-from physics import Space, Pos, clamp, Projectile
+from entities import Spawn, Object, AK47, Brochette
+from explosion import Explosion
+from helper import DirtySurface
+from physics import Space, Pos, clamp, Projectile, ProjectileArray
+from sprites import SPRITES
 
 LOGGER = logging.getLogger(__name__)
 
+# Flags of the collision map
+SOLID = 1
+DEADLY = 2
+END = 4
+
+# Extent of the colliders around the map, in blocks. See Level.colliders_in
+FAR = 10 ** 9
+
+CHUNK_COLORKEY = (255, 0, 255)
+
+# Parsed levels, by path: (modification time, level). See Level.load
+TEMPLATES = {}
+
+# Properties of the blocks by code, to work on the whole grid at once
+STATEFUL = [block.stateful for block in FLYWEIGHTS] + [False] * (256 - len(FLYWEIGHTS))
+CHARACTER_TABLE = bytes(ord(c) for c in CHARACTERS.ljust(256, "."))
+AUTOTILE_SOLID = np.zeros(256, dtype=np.uint8)
+AUTOTILE_SOLID[:len(FLYWEIGHTS)] = [block.autotile_solid for block in FLYWEIGHTS]
+
 
 class Level:
     OFFSET_THRESHOLD = 40 / 100
+    DEFAULT_BLOCK_SIZE = Block.DEFAULT_BLOCK_SIZE
+    CHUNK_SIZE = 16  # in blocks
 
     def __init__(self):
         LOGGER.info("Initialized new level")
         self.num = 0
+        self.path = ""
         self.space = Space(self, gravity=(0, 1))
-        self.size = Pos(0, 0)
-        self.grid = []  # type: List[List[Block]]
+        self.brochettes = ProjectileArray(Brochette, FRAME_BEFORE_DESPAWN)
+        self.space.add(self.brochettes)
+        self.size = (0, 0)  # (width, height) in blocks
+        self.grid = bytearray()  # code of each block (see blocks.CODES), line by line, with a border of Stone
+        self.stride = 2  # length of a line of the grid, border included
         self.objects = []
         self.start = (0, 0)  # Where the players has to spawn, map coordinates
         self.offset = Pos(0, 0)  # Where we start to draw the map, world coordinates
@@ -30,15 +60,25 @@ class Level:
         self.over = False
         self.to_reset = False
         self.exploding = False
-        self.to_explode = []
-        self.exploded = []
-        self.particles = []
-        self.img_cache = {}
+        self.explosion = None  # type: Explosion
+        self.collision_map = bytearray()  # SOLID/DEADLY flags of each block of the grid, border included
+        self.autotile_masks = np.zeros((0, 0), dtype=np.uint8)  # neighbour mask of each block, see Block.get_img
+        self.solid_array = np.ones((2, 2), dtype=bool)  # solid blocks as [y + 1, x + 1], with a solid border around
+        self.colliders = None  # solid blocks merged in rectangles, see update_colliders
+        self.colliders_by_line = []  # for each line, the colliders crossing it sorted by x
+        self.colliders_x = []  # and their x, to bisect
+        self.chunks = {}  # chunk pos -> (static blocks pre-rendered or None if empty, animated blocks)
+        self.maps_shared = False  # the maps above are shared with other copies of the level, see own_maps
+        self.stateful_blocks = {}  # map position -> block, for the blocks that need their own instance
+        self.tick = 0  # number of calls to internal_logic, the clock of the timers below
+        self.timers = defaultdict(list)  # tick -> positions of the awake blocks to wake then
+        self.due = None  # position -> tick of the next internal_logic of each stateful block, see update_awake
+        self.awake = set()  # positions of the stateful blocks near the screen, the only ones with timers
+        self.awake_window = None  # (left, top, right, bottom) map range of the awake blocks, right/bottom excluded
 
     def __str__(self):
-        return "\n".join([
-            "".join(c.character for c in line) for line in self.grid
-        ])
+        text = self.grid.translate(CHARACTER_TABLE).decode()
+        return "\n".join(text[y * self.stride + 1:(y + 1) * self.stride - 1] for y in range(1, self.size[1] + 1))
 
     @property
     def world_start(self):
@@ -50,18 +90,18 @@ class Level:
 
     @staticmethod
     def world_to_map(world_pos):
-        return (Pos(world_pos) // Block.DEFAULT_BLOCK_SIZE).i
+        return int(world_pos[0] // Block.DEFAULT_BLOCK_SIZE), int(world_pos[1] // Block.DEFAULT_BLOCK_SIZE)
 
     def map_to_display(self, map_pos):
         return Pos(map_pos[0] * Block.DEFAULT_BLOCK_SIZE - self.offset.x,
                    map_pos[1] * Block.DEFAULT_BLOCK_SIZE - self.offset.y)
 
     def display_to_map(self, display_pos):
-        return Pos((display_pos[0] + self.offset.x) // Block.DEFAULT_BLOCK_SIZE,
-                   (display_pos[1] + self.offset.y) // Block.DEFAULT_BLOCK_SIZE)
+        return (int((display_pos[0] + self.offset.x) // Block.DEFAULT_BLOCK_SIZE),
+                int((display_pos[1] + self.offset.y) // Block.DEFAULT_BLOCK_SIZE))
 
     def inside_map(self, map_pos):
-        return 0 <= map_pos[0] < self.size.x and 0 <= map_pos[1] < self.size.y
+        return 0 <= map_pos[0] < self.size[0] and 0 <= map_pos[1] < self.size[1]
 
     def inside_display(self, map_pos):
         world = self.map_to_world(map_pos)
@@ -69,13 +109,219 @@ class Level:
                 self.offset.y <= world.y < self.offset.y + self.screen_size[1])
 
     def get_block(self, map_pos):
+        """
+        The block at map_pos. Everything outside the map is Stone, like the border just around it.
+
+        The physics and the autotiling never look further than the border (counting_lookups checks it),
+        but the grid is flat, so the positions beyond it must not reach it: they would wrap to another line.
+        """
+
+        x, y = map_pos
+        if not (-1 <= x <= self.size[0] and -1 <= y <= self.size[1]):
+            return FLYWEIGHTS[CODES[Stone.character]]
+        code = self.grid[(y + 1) * self.stride + x + 1]
+        if STATEFUL[code]:
+            return self.stateful_blocks[x, y]
+        return FLYWEIGHTS[code]
+
+    @classmethod
+    @contextmanager
+    def counting_lookups(cls):
+        """
+        Count the get_block calls of all the levels by where they land, while in the with block.
+
+        It yields the Counter. It is slower, for debugging.
+        """
+
+        lookups = Counter()
+        fast_get_block = cls.get_block
+
+        def get_block(self, map_pos):
+            x, y = map_pos
+            if self.inside_map(map_pos):
+                lookups["map"] += 1
+            elif -1 <= x <= self.size[0] and -1 <= y <= self.size[1]:
+                lookups["border"] += 1
+            else:
+                lookups["outside"] += 1
+            return fast_get_block(self, map_pos)
+
+        cls.get_block = get_block
+        try:
+            yield lookups
+        finally:
+            cls.get_block = fast_get_block
+
+    def set_blocks(self, lines):
+        """Fill the grid with the blocks given by their character, line by line. Missing blocks are air.
+
+        Call update_maps after."""
+
+        width, height = self.size
+        lines = list(lines[:height]) + [""] * (height - len(lines))
+        border = Stone.character
+        lines = [border * (width + 2)] + [border + line[:width].ljust(width, ".") + border for line in lines] \
+            + [border * (width + 2)]
+        self.stride = width + 2
+        self.grid = bytearray(CODES.get(c, 0) for line in lines for c in line)
+        self.stateful_blocks = {}
+        for i, code in enumerate(self.grid):
+            if STATEFUL[code]:
+                pos = i % self.stride - 1, i // self.stride - 1
+                self.stateful_blocks[pos] = Block.new(CHARACTERS[code], pos)
+
+    def set_block(self, map_pos, block):
+        """Put the block in the grid, at map_pos. The maps are updated too."""
+
         x, y = map_pos
-        if self.inside_map(map_pos):
-            return self.grid[y][x]
+        if not self.inside_map(map_pos):
+            raise IndexError(f"{map_pos} is outside of the map, of size {self.size}")
+        self.own_maps()
+        self.grid[(y + 1) * self.stride + x + 1] = CODES.get(block.character, 0)
+        if block.stateful:
+            self.stateful_blocks[x, y] = block
+        else:
+            self.stateful_blocks.pop((x, y), None)
+        self.awake.discard((x, y))
+        if self.due is not None:
+            self.due.pop((x, y), None)
+        self.awake_window = None  # look for the awake blocks again
+        self.update_maps_at(map_pos)
 
-        # TODO: this happens way to often. Why the fuck?!
-        # LOGGER.debug(f"Level - get_block - {x}, {y} not inside map. Return a Stone by default.")
-        return Stone()
+    @staticmethod
+    def collision_flags(block):
+        if not block.solid:
+            return 0
+        if block.character == EndBlock.character:
+            return SOLID | END
+        return SOLID | DEADLY if block.deadly else SOLID
+
+    def update_maps(self):
+        """Rebuild the collision map and autotiling masks from the grid. Call it once the grid is loaded."""
+        self.own_maps()
+        self.collision_map = self.grid.translate(COLLISION_FLAGS)
+        self.brochettes.impacts.clear()
+
+        # All the masks in one go: each neighbour is the whole solid grid shifted.
+        # The map is surrounded by solid blocks, the Stone border of the grid.
+        width, height = self.size
+        collision_map = np.frombuffer(self.collision_map, dtype=np.uint8).reshape(height + 2, width + 2)
+        self.solid_array = (collision_map & SOLID).astype(bool)
+        self.update_colliders()
+
+        solid = AUTOTILE_SOLID[np.frombuffer(self.grid, dtype=np.uint8).reshape(height + 2, width + 2)]
+        self.autotile_masks = np.zeros((height, width), dtype=np.uint8)
+        for bit, (dx, dy) in enumerate(NEIGHBOURS):
+            self.autotile_masks |= solid[1 + dy:1 + dy + height, 1 + dx:1 + dx + width] << np.uint8(bit)
+
+    def own_maps(self):
+        """Copy the maps shared with other copies of the level (see copy), to change them without changing theirs."""
+        if not self.maps_shared:
+            return
+        self.collision_map = bytearray(self.collision_map)
+        self.solid_array = self.solid_array.copy()
+        self.autotile_masks = self.autotile_masks.copy()
+        self.chunks = dict(self.chunks)
+        self.brochettes.impacts = dict(self.brochettes.impacts)
+        self.maps_shared = False
+
+    def update_maps_at(self, map_pos):
+        """Update the collision map and autotiling masks after the block at map_pos changed."""
+        x, y = map_pos
+        i = (y + 1) * self.stride + x + 1
+        self.collision_map[i] = COLLISION_FLAGS[self.grid[i]]
+        self.solid_array[y + 1, x + 1] = self.collision_map[i] & SOLID
+        self.brochettes.impacts.clear()
+        self.colliders = None  # merged again when needed, the editor changes many blocks in a row
+        for dx, dy in NEIGHBOURS:
+            if self.inside_map((x + dx, y + dy)):
+                self.autotile_masks[y + dy, x + dx] = self.compute_autotile_mask((x + dx, y + dy))
+
+    def compute_autotile_mask(self, map_pos):
+        mask = 0
+        for bit, (dx, dy) in enumerate(NEIGHBOURS):
+            if self.get_block((map_pos[0] + dx, map_pos[1] + dy)).autotile_solid:
+                mask |= 1 << bit
+        return mask
+
+    def update_colliders(self):
+        """
+        Merge the solid blocks in as few rectangles as possible, for the physics.
+
+        Only blocks with the same collision flags are merged (greedy meshing: the longest run
+        on a line, then extended down as long as the lines below have the same run).
+        Each collider is (x, y, end x, end y, flags) in map coordinates, the ends excluded.
+        """
+
+        width, height = self.size
+        flags = [list(self.collision_map[y * self.stride + 1:(y + 1) * self.stride - 1]) for y in range(1, height + 1)]
+        todo = [[f & SOLID for f in line] for line in flags]
+
+        colliders = []
+        for y in range(height):
+            x = 0
+            while x < width:
+                if not todo[y][x]:
+                    x += 1
+                    continue
+
+                kind = flags[y][x]
+                end_x = x + 1
+                while end_x < width and todo[y][end_x] and flags[y][end_x] == kind:
+                    end_x += 1
+
+                run = [kind] * (end_x - x)
+                end_y = y + 1
+                while end_y < height and all(todo[end_y][x:end_x]) and flags[end_y][x:end_x] == run:
+                    end_y += 1
+
+                for line in todo[y:end_y]:
+                    line[x:end_x] = [0] * (end_x - x)
+                colliders.append((x, y, end_x, end_y, kind))
+                x = end_x
+
+        # the cells outside the map are solid, like the border of the grid
+        border = [(-FAR, -FAR, 0, FAR, SOLID), (width, -FAR, FAR, FAR, SOLID),
+                  (0, -FAR, width, 0, SOLID), (0, height, width, FAR, SOLID)]
+
+        self.colliders = colliders + border
+        self.colliders_by_line = [[] for _ in range(height)]
+        for collider in sorted(colliders):
+            for y in range(collider[1], collider[3]):
+                self.colliders_by_line[y].append(collider)
+        self.colliders_x = [[collider[0] for collider in line] for line in self.colliders_by_line]
+        LOGGER.info("Merged the solid blocks in %s colliders", len(colliders))
+
+    def colliders_in(self, left, top, right, bottom):
+        """
+        Return the colliders overlapping the given world rectangle, see update_colliders.
+
+        The cells outside the map are covered by colliders too.
+        """
+
+        if self.colliders is None:
+            self.update_colliders()
+
+        size = self.DEFAULT_BLOCK_SIZE
+        start_x, end_x = int(left // size), int(-(-right // size))
+        start_y, end_y = int(top // size), int(-(-bottom // size))
+        height = len(self.colliders_by_line)
+
+        found = {}
+        for y in range(max(start_y, 0), min(end_y, height)):
+            line = self.colliders_by_line[y]
+            # the colliders of a line do not overlap, so the ones before end_x are sorted by their end too
+            i = bisect_left(self.colliders_x[y], end_x)
+            while i > 0 and line[i - 1][2] > start_x:
+                i -= 1
+                found[line[i]] = None
+
+        if start_x < 0 or start_y < 0 or end_x > self.size[0] or end_y > height:
+            for collider in self.colliders[-4:]:
+                if collider[0] < end_x and start_x < collider[2] and collider[1] < end_y and start_y < collider[3]:
+                    found[collider] = None
+
+        return list(found)
 
     def get_slice(self, map_top_left, map_bottom_right):
         """Return a list of all block totally covering the given rectangle."""
@@ -95,19 +341,8 @@ class Level:
         return self.get_block(map_pos)
 
     def get_img_at(self, map_pos):
-        if map_pos in self.img_cache:
-            return self.img_cache[map_pos]
-
-        neigh = "".join(self.get_block((map_pos[0] + dx, map_pos[1] + dy)).character
-                        for dy in range(-1, 2)
-                        for dx in range(-1, 2))
         block = self.get_block(map_pos)
-        img = block.get_img(neigh, rotation=block.rotation)
-
-        if not block.IGNORE_IMG_CACHE:
-            self.img_cache[map_pos] = img
-
-        return img
+        return block.get_img(int(self.autotile_masks[map_pos[1], map_pos[0]]), rotation=block.rotation)
 
     @property
     def world_size(self):
@@ -116,21 +351,74 @@ class Level:
 
     @classmethod
     def load(cls, path, num=-1):
+        """
+        Load a playable level from a map file.
+
+        The file is parsed only the first time or when it was modified (by the editor for instance),
+        afterwards the level is copied from the parsed one, which is way faster when respawning.
+        """
+        mtime = os.stat(path).st_mtime_ns
+        cached = TEMPLATES.get(path)
+        if cached is None or cached[0] != mtime or not isinstance(cached[1], cls):
+            template = cls.parse(path, num)
+            if template is None:
+                return None
+            TEMPLATES[path] = mtime, template
+        else:
+            LOGGER.info(f"Map {num} from path {path} is already parsed, copying it.")
+            template = cached[1]
+
+        return template.copy(num)
+
+    @classmethod
+    def parse(cls, path, num=-1):
         LOGGER.info(f"Starting to load map {num} from path {path}")
+        level = None
         try:
             level = cls.load_v1(path)
-            level.path = path
-            return level
         except Exception as e:
             LOGGER.info(f"Could not load map as v1. This is ok as we should only have v2 maps. "
                         f"To be deprecated. Here is the actual exception: {e}")
 
-        try:
-            level = cls.load_v2(path, num)
-            level.path = path
-            return level
-        except Exception as e:
-            LOGGER.critical(f"Could not load map as v2. Here is the exception: {e}")
+        if level is None:
+            try:
+                level = cls.load_v2(path, num)
+            except Exception as e:
+                LOGGER.critical(f"Could not load map as v2. Here is the exception: {e}")
+                return None
+
+        LOGGER.info("Sprites: %s", SPRITES)
+        level.path = path
+        return level
+
+    def copy(self, num=-1):
+        """
+        Return a new playable level from this one.
+
+        Everything that does not change during a game (stateless blocks, images, collision map...)
+        is shared, the rest (emitters, objects, projectiles...) is created anew. The shared maps are
+        copied by the first set_block of either level.
+        """
+        level = self.__class__()
+        level.path = self.path
+        level.num = num
+        level.size = self.size
+        level.start = self.start
+        level.grid = bytearray(self.grid)
+        level.stride = self.stride
+        level.stateful_blocks = {pos: Block.new(block.character, pos) for pos, block in self.stateful_blocks.items()}
+        level.collision_map = self.collision_map
+        level.solid_array = self.solid_array
+        level.colliders = self.colliders
+        level.colliders_by_line = self.colliders_by_line
+        level.colliders_x = self.colliders_x
+        level.brochettes.impacts = self.brochettes.impacts
+        level.autotile_masks = self.autotile_masks
+        level.chunks = self.chunks
+        level.maps_shared = self.maps_shared = True
+        level.objects = [Object.from_json(obj.save()) for obj in self.objects]
+        level.spawn_objects(num)
+        return level
 
     @classmethod
     def load_v2(cls, path, num=-1, is_editor=False):
@@ -139,41 +427,36 @@ class Level:
             d = json.loads(f.read())
         LOGGER.info("Dict loaded: %s", d)
 
-        size = Pos(d["size"])
+        size = tuple(d["size"])
         LOGGER.info("Level size: %s", size)
-        map = [
-            [
-                Block.new(c, (x, y))
-                for x, c in enumerate(line)
-            ]
-            for y, line in enumerate(d["blocks"])
-        ]
         objects = [Object.from_json(o) for o in d["objects"]]
         LOGGER.info("Loaded %s objects", len(objects))
 
         level = cls()
         level.size = size
-        level.grid = map
+        level.set_blocks(d["blocks"])
         level.objects = objects
+        level.update_maps()
+        level.spawn_objects(num, is_editor)
+
+        LOGGER.info("Loaded as v2.")
+        return level
 
-        # spawn
-        for obj in objects:
+    def spawn_objects(self, num=-1, is_editor=False):
+        for obj in self.objects:
             if isinstance(obj, Spawn):
-                level.start = obj.pos
+                self.start = obj.pos
                 LOGGER.info("Spawn set at %s", obj.pos)
             elif isinstance(obj, Projectile):
                 if not is_editor and isinstance(obj, AK47) and CONFIG.levels_stats[str(num)][2] >= 1:
                     pass
                 else:
-                    level.spawn(obj)
-
-        LOGGER.info("Loaded as v2.")
-        return level
+                    self.spawn(obj)
 
     def save(self, path):
         LOGGER.info("Saving level to %s", path)
         d = dict()
-        d["size"] = self.size.ti
+        d["size"] = self.size
         d["blocks"] = str(self).splitlines(keepends=False)
         d["objects"] = [obj.save() for obj in self.objects]
         d["version"] = 2
@@ -199,14 +482,15 @@ class Level:
 
         with open(path, 'r') as map_file:
             height, width = list(map(int, map_file.readline().split()))
-            level.size = Pos(width, height)
+            level.size = (width, height)
+            lines = []
             for h in range(height):
-                line = list(map_file.readline().strip())
-                for i in range(len(line)):
-                    if line[i] == START:
-                        level.start = (i, h)
-                    line[i] = Block.new(line[i], (i, h))
-                level.grid.append(line)
+                line = map_file.readline().strip()
+                if START in line:
+                    level.start = (line.rindex(START), h)
+                lines.append(line)
+        level.set_blocks(lines)
+        level.update_maps()
 
         LOGGER.warning(f"Loaded as v1. To be deprecated")
         return level
@@ -235,40 +519,189 @@ class Level:
 
     def internal_logic(self):
         if self.exploding:
-            self.explosion_logic()
+            self.explosion.logic()
+            self.over = self.explosion.over
+            return
+
+        start_x, start_y = self.world_to_map(self.offset)
+        screen_w, screen_h = self.world_to_map(self.screen_size)
+        end_x, end_y = start_x + screen_w, start_y + screen_h
+
+        window = (clamp(start_x - 20, 0, self.size[0] - 1), clamp(start_y - 20, 0, self.size[1] - 1),
+                  clamp(end_x + 20, 0, self.size[0] - 1), clamp(end_y + 20, 0, self.size[1] - 1))
+        if window != self.awake_window:
+            self.update_awake(window)
+        self.wake_blocks()
+        self.tick += 1
+
+    def update_awake(self, window):
+        """
+        Wake the stateful blocks inside the window and put the others to sleep.
+
+        The sleeping blocks cost nothing: their due tick is kept, and when they wake up
+        they catch up with what they missed (see FieryBarbecue.catch_up). So they behave
+        the same wherever the camera is.
+        """
+
+        if self.due is None:
+            self.due = {pos: self.tick + block.next_spawn - 1 for pos, block in self.stateful_blocks.items()}
+
+        left, top, right, bottom = window
+        for pos in list(self.awake):
+            x, y = pos
+            if not (left <= x < right and top <= y < bottom):
+                self.awake.remove(pos)
+
+        for pos, block in self.stateful_blocks.items():
+            x, y = pos
+            if left <= x < right and top <= y < bottom and pos not in self.awake:
+                self.due.setdefault(pos, self.tick + block.next_spawn - 1)  # added in the editor
+                if self.due[pos] < self.tick:
+                    self.due[pos] = block.catch_up(self, self.due[pos])
+                self.awake.add(pos)
+                self.timers[self.due[pos]].append(pos)
+        self.awake_window = window
+
+    def wake_blocks(self):
+        """Call the internal_logic of the blocks whose timer ends this tick."""
+
+        due = self.timers.pop(self.tick, None)
+        if due is None:
             return
 
-        offset = self.world_to_map(self.offset)
-        offset_end = (offset + self.world_to_map(self.screen_size)).i
+        # line by line, like a scan of the screen, so the random draws happen in the same order
+        due.sort(key=lambda pos: (pos[1], pos[0]))
+        for pos in due:
+            if pos not in self.awake or self.due[pos] != self.tick:
+                continue  # it fell asleep or was already woken
+            block = self.stateful_blocks[pos]
+            block.internal_logic(self)
+            self.due[pos] = self.tick + block.next_spawn
+            self.timers[self.due[pos]].append(pos)
+
+    def sync_timers(self):
+        """Write the remaining time of the blocks in their next_spawn. It is negative if they slept past it."""
+
+        for pos, due in (self.due or {}).items():
+            self.stateful_blocks[pos].next_spawn = due - self.tick + 1
+
+    def positions(self):
+        """Where the camera and the bodies are, to draw the frames until the next tick from them, see Frame."""
+        return Pos(self.offset), {body: Pos(body.shape.topleft)
+                                  for body in self.space.moving_bodies + self.space.projectiles}
 
-        for line in range(clamp(offset.y - 20, 0, self.size[1] - 1),
-                          clamp(offset_end.y + 20, 0, self.size[1] - 1)):
-            for block in range(clamp(offset.x - 20, 0, self.size[0] - 1),
-                               clamp(offset_end.x + 20, 0, self.size[0] - 1)):
-                block = self.grid[line][block]
-                block.internal_logic(self)
+    def render(self, surf, rects=None):
+        """
+        Draw the level. With rects, the blocks are only drawn again inside those display rects.
+
+        Return the rects of what moves or is animated, they change on the next frame. None during the explosion.
+        """
 
-    def render(self, surf):
         if self.exploding:
-            self.render_explode(surf)
-            return
+            self.explosion.render(surf)
+            return None
 
         self.screen_size = Pos(surf.get_size())
-        offset = self.world_to_map(self.offset)
-        offset_end = (offset + self.world_to_map(self.screen_size))
-
-        for line in range(clamp(offset.y, 0, self.size[1] - 1),
-                          clamp(offset_end.y + 2, 0, self.size[1])):
-            for block in range(clamp(offset.x, 0, self.size[0] - 1),
-                               clamp(offset_end.x + 2, 0, self.size[0])):
-                if self.grid[line][block].visible:
-                    surf.blit(self.get_img_at((block, line)), self.map_to_world((block, line)) - self.offset)
+        moving = self.render_blocks(surf, self.offset, rects)
 
         for body in self.space.moving_bodies:
-            body.render(surf, -self.offset)
+            body.render(moving, -self.offset)
 
         for proj in self.space.projectiles:
-            proj.render(surf, -self.offset)
+            proj.render(moving, -self.offset)
+
+        for proj in self.brochettes.views():
+            proj.render(moving, -self.offset)
+        return moving.rects
+
+    def render_blocks(self, surf, offset, rects=None):
+        """
+        Draw the blocks seen from the offset, only inside the display rects if given.
+
+        Return a DirtySurface on surf that recorded where the animated blocks were drawn.
+        """
+
+        chunk_size = self.CHUNK_SIZE
+        animated_blocks = []
+        for chunk_x, chunk_y in self.visible_chunks(offset, surf.get_size()):
+            static, animated = self.get_chunk((chunk_x, chunk_y))
+            if static is not None:
+                # floor the position as chunks often start off screen, where blit would round towards zero
+                pos = (self.map_to_world((chunk_x * chunk_size, chunk_y * chunk_size)) - offset) // 1
+                if rects is None:
+                    surf.blit(static, pos)
+                else:
+                    chunk_rect = static.get_rect(topleft=pos)
+                    for i in chunk_rect.collidelistall(rects):
+                        clip = chunk_rect.clip(rects[i])
+                        surf.blit(static, clip, clip.move(-pos[0], -pos[1]))
+            animated_blocks.extend(animated)
+
+        moving = DirtySurface(surf)
+        for pos in animated_blocks:
+            moving.blit(self.get_img_at(pos), self.map_to_world(pos) - offset)
+        return moving
+
+    def visible_chunks(self, offset, screen_size, margin=0):
+        """Positions of the chunks seen on a display of screen_size from offset, and margin chunks around."""
+
+        start_x, start_y = self.world_to_map(offset)
+        screen_w, screen_h = self.world_to_map(screen_size)
+        end_x, end_y = start_x + screen_w, start_y + screen_h
+
+        chunk_size = self.CHUNK_SIZE
+        last_x, last_y = (self.size[0] - 1) // chunk_size, (self.size[1] - 1) // chunk_size
+        for chunk_y in range(max(clamp(start_y, 0, self.size[1] - 1) // chunk_size - margin, 0),
+                             min((clamp(end_y + 2, 0, self.size[1]) - 1) // chunk_size + margin, last_y) + 1):
+            for chunk_x in range(max(clamp(start_x, 0, self.size[0] - 1) // chunk_size - margin, 0),
+                                 min((clamp(end_x + 2, 0, self.size[0]) - 1) // chunk_size + margin, last_x) + 1):
+                yield chunk_x, chunk_y
+
+    def bake_visible_chunks(self, margin=1):
+        """Bake now the chunks on screen and margin chunks around, instead of when they are first drawn."""
+        for chunk_pos in self.visible_chunks(self.offset, self.screen_size, margin):
+            self.get_chunk(chunk_pos)
+
+    def get_chunk(self, chunk_pos):
+        """Return the pre-rendered static blocks of a chunk and the positions of its animated blocks."""
+        if chunk_pos not in self.chunks:
+            self.chunks[chunk_pos] = self.bake_chunk(chunk_pos)
+        return self.chunks[chunk_pos]
+
+    def bake_chunk(self, chunk_pos):
+        chunk_size = self.CHUNK_SIZE
+        block_size = self.DEFAULT_BLOCK_SIZE
+        start_x = chunk_pos[0] * chunk_size
+        start_y = chunk_pos[1] * chunk_size
+
+        static = None
+        animated = []
+        for y in range(start_y, min(start_y + chunk_size, self.size[1])):
+            for x in range(start_x, min(start_x + chunk_size, self.size[0])):
+                block = FLYWEIGHTS[self.grid[(y + 1) * self.stride + x + 1]]
+                if not block.visible:
+                    continue
+                if block.IGNORE_IMG_CACHE:
+                    animated.append((x, y))
+                    continue
+
+                if static is None:
+                    static = pygame.Surface((chunk_size * block_size, chunk_size * block_size))
+                    static.fill(CHUNK_COLORKEY)
+                static.blit(self.get_img_at((x, y)), ((x - start_x) * block_size, (y - start_y) * block_size))
+
+        if static is not None:
+            # RLE lets the blit skip the (many) transparent runs of the chunk
+            static.set_colorkey(CHUNK_COLORKEY, pygame.RLEACCEL)
+        return static, animated
+
+    def invalidate_chunks_around(self, map_pos):
+        """Forget the chunks whose images depend on the block at map_pos."""
+        self.own_maps()
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                chunk_pos = (map_pos[0] + dx) // self.CHUNK_SIZE, (map_pos[1] + dy) // self.CHUNK_SIZE
+                self.chunks.pop(chunk_pos, None)
 
     def spawn(self, body):
         self.space.add(body)
@@ -277,63 +710,10 @@ class Level:
         LOGGER.info("Level: to_reset = True")
         self.to_reset = True
 
-    def explode(self, start_pos):
+    def explode(self, start_pos=None):
         LOGGER.info("Starting to explode the level.")
         self.exploding = True
-        self.to_explode = [
-            b
-            for line in self.grid
-            for b in line
-            if self.inside_display(b.pos) and b.visible
-        ]
-        self.exploded = []
-        LOGGER.info(f"We're going to explode {len(self.to_explode)} blocks")
-
-    def explosion_logic(self):
-
-        for part in self.particles:
-            part.internal_logic()
-        self.particles = [p for p in self.particles if not p.dead and p.pos.y < self.screen_size[1]]
-
-        for i in range(min(5, len(self.to_explode))):
-            b = random.choice(self.to_explode)
-            self.to_explode.remove(b)
-            self.exploded.append(b)
-            b.explode()
-            # particles
-            for i in range(5):
-                angle = random.randint(0, 360)
-                velocity = 25 * Pos.unit_y().rotate(angle)
-                pos = self.map_to_display(b.pos)
-                self.particles.append(Particle(pos, velocity, size=6))
-            CONFIG.levels_stats[str(self.num)][3] += 1
-
-        if not self.to_explode and not self.exploded and not self.particles:
-            self.over = True
-        return
-
-    def render_explode(self, surf):
-        t = time()
-
-        for block in self.to_explode:
-            world_pos = self.map_to_display(block.pos)
-            surf.blit(self.get_img_at(block.pos), world_pos)
-
-        for block in self.exploded[:]:
-            world_pos = self.map_to_display(block.pos)
-            if block.visible:
-                surf.blit(self.get_img_at(block.pos), world_pos)
-            surf.blit(get_boom_img(int(block.explode_frame)), world_pos - (16, 16))
-
-            if block.explode_frame <= 15:
-                block.explode_frame += 1/3
-                if block.explode_frame > 4:
-                    block.visible = False
-            else:
-                self.exploded.remove(block)
+        self.explosion = Explosion(self)
 
-        for part in self.particles:
-            part.render(surf)
 
-        dx, dy = random.randint(-5, 6), random.randint(-5, 6)
-        surf.scroll(dx, dy)
+COLLISION_FLAGS = bytes(Level.collision_flags(block) for block in FLYWEIGHTS).ljust(256, b"\0")
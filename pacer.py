@@ -0,0 +1,151 @@
+"""
+How many frames per second the screens ask for.
+
+The App loop ticks its clock at the FPS of the current screen, so a screen that
+takes its FPS from a FramePacer draws as fast as the display can show it, and
+barely at all when nobody looks at the window.
+"""
+import os
+import ctypes
+import ctypes.util
+import logging
+from collections import deque
+from functools import lru_cache
+from glob import glob
+from time import perf_counter
+import pygame
+
+LOGGER = logging.getLogger(__name__)
+
+SDL_INIT_VIDEO = 0x20
+
+
+class SDLDisplayMode(ctypes.Structure):
+    _fields_ = [("format", ctypes.c_uint32), ("w", ctypes.c_int), ("h", ctypes.c_int),
+                ("refresh_rate", ctypes.c_int), ("driverdata", ctypes.c_void_p)]
+
+
+@lru_cache()
+def sdl_library():
+    """
+    The SDL library pygame runs on, to ask it what pygame does not expose. None if it is not found.
+
+    The one bundled in the pygame wheels is the one pygame loaded. Without it, the system's SDL is
+    tried, but it may be another copy than pygame's, so check with SDL_WasInit that it is in use.
+    """
+
+    folder = os.path.dirname(pygame.__file__)
+    paths = (glob(os.path.join(folder, os.pardir, "pygame.libs", "libSDL2-2*"))  # linux wheels
+             + glob(os.path.join(folder, ".dylibs", "libSDL2*"))  # macos wheels
+             + glob(os.path.join(folder, "SDL2.dll")))  # windows wheels
+    system = ctypes.util.find_library("SDL2")  # pygame built on the system's SDL
+    if system is not None:
+        paths.append(system)
+
+    for path in paths:
+        try:
+            return ctypes.CDLL(path)
+        except OSError:
+            continue
+    LOGGER.info("SDL library not found, the refresh rate of the display is unknown")
+    return None
+
+
+def refresh_rate(default=60):
+    """Refresh rate of the display of the window, or default when SDL can't tell."""
+
+    # pygame-ce has it
+    get_rates = getattr(pygame.display, "get_desktop_refresh_rates", None)
+    if get_rates is not None:
+        try:
+            rates = get_rates()
+        except pygame.error:
+            rates = []
+        return rates[0] if rates and rates[0] > 0 else default
+
+    sdl = sdl_library()
+    if sdl is None or not sdl.SDL_WasInit(SDL_INIT_VIDEO):
+        # another SDL than pygame's would answer garbage, or errors
+        return default
+    try:
+        # a private module of pygame, that may move or go
+        from pygame._sdl2.video import Window
+        index = Window.from_display_module().display_index
+    except (ImportError, AttributeError):
+        return default
+    except pygame.error:
+        index = 0
+    mode = SDLDisplayMode()
+    if sdl.SDL_GetCurrentDisplayMode(index, ctypes.byref(mode)) != 0 or mode.refresh_rate <= 0:
+        return default
+    return mode.refresh_rate
+
+
+def enable_vsync(display):
+    """Open again the display so that flip waits for the refresh of the screen. Return None if it can't."""
+    try:
+        # pygame only syncs the SCALED and OPENGL displays
+        return pygame.display.set_mode(display.get_size(), pygame.SCALED, vsync=1)
+    except pygame.error as e:
+        LOGGER.warning(f"Could not enable vsync: {e}")
+        return None
+
+
+def window_visible():
+    """Whether the window is shown and focused."""
+    return pygame.display.get_active() and pygame.key.get_focused()
+
+
+class FramePacer:
+    """
+    The frame rate a screen should run at, and a measure of the one it gets.
+
+    It follows the refresh rate of the display, capped at max_fps, and drops to
+    QUIET_FPS when the screen has nothing new to show, to hidden_fps when the
+    window is iconified or not focused.
+    """
+
+    QUIET_FPS = 20
+    HIDDEN_FPS = 5
+    REPORT_EVERY = 10  # seconds between two logs of the frame times
+
+    def __init__(self, max_fps=None, hidden_fps=HIDDEN_FPS):
+        self.max_fps = max_fps
+        self.hidden_fps = hidden_fps
+        self.refresh_rate = refresh_rate()
+        self.target = self.refresh_rate if max_fps is None else min(self.refresh_rate, max_fps)
+        self.current = self.target  # the last rate given by fps
+        self.frame_times = deque(maxlen=600)  # seconds between the last frames
+        self.last_frame = None
+        self.last_report = perf_counter()
+
+    def fps(self, busy=True):
+        """The frame rate to run at now. Not busy means that the next frames would be the same as the last one."""
+        if not window_visible():
+            fps = self.hidden_fps
+        elif not busy:
+            fps = min(self.QUIET_FPS, self.target)
+        else:
+            fps = self.target
+        self.current = fps
+        return fps
+
+    def frame(self):
+        """Record the time since the last frame, and log how it compares to the target now and then."""
+
+        now = perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+        self.last_frame = now
+
+        if now - self.last_report > self.REPORT_EVERY and self.frame_times:
+            self.last_report = now
+            achieved, worst = self.report()
+            LOGGER.debug(f"Frame times: {achieved:.1f}ms on average, {worst:.1f}ms at worst, "
+                         f"target {1000 / self.current:.1f}ms")
+
+    def report(self):
+        """Average and worst frame time of the last frames, in milliseconds."""
+        if not self.frame_times:
+            return 0, 0
+        return 1000 * sum(self.frame_times) / len(self.frame_times), 1000 * max(self.frame_times)
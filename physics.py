@@ -4,12 +4,16 @@ Custom physics engine that take care only of AABBs.
 Maybe one day it'll get bigger.
 """
 import logging
-from enum import Enum, auto
-from math import cos, sin, pi, sqrt
-from typing import List, TYPE_CHECKING
+from enum import Enum, IntFlag, auto
+from math import cos, sin, pi
+from typing import Dict, List, Tuple, TYPE_CHECKING
 from typing import Union
+import numpy as np
 import pygame
 
+from constants import DEFAULT_BLOCK_SIZE
+from helper import get_state, set_state
+
 if TYPE_CHECKING:
     from level import Level, Block
 
@@ -23,14 +27,76 @@ class CollisionType(Enum):
     OBJECT = auto()
 
 
+class Layer(IntFlag):
+    """Collision layers of the projectiles, a body is only tested against the layers of its collision mask."""
+    PICKUP = auto()
+    DEADLY = auto()
+
+
 class CollisionData:
+    __slots__ = ("type", "object", "shape")
+
     def __init__(self, type: CollisionType, obj, shape):
+        self.reset(type, obj, shape)
+
+    def __str__(self):
+        return f"<CollisionData(type={self.type}, object={self.object}, shape={self.shape})>"
+
+    def reset(self, type: CollisionType, obj, shape):
         self.type = type
         self.object = obj  # type: Union[Body, Projectile, Block]
         self.shape = shape
 
+
+class Pool:
+    """
+    Objects released to be used again instead of allocating new ones.
+
+    The class of the objects needs a reset method that takes the same arguments as __init__.
+    Released objects must not be used anymore: they will be reset by the next acquire.
+    """
+
+    def __init__(self, cls, max_size=4096):
+        self.cls = cls
+        self.max_size = max_size  # free objects kept, the others are left to the garbage collector
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        self.released = 0
+        POOLS.append(self)
+
+    def __len__(self):
+        return len(self.free)
+
     def __str__(self):
-        return f"<CollisionData(type={self.type}, object={self.object}, shape={self.shape})>"
+        return (f"<Pool of {self.cls.__name__}: {len(self)} free, {self.created} created, "
+                f"{self.reused} reused, {self.released} released>")
+
+    def acquire(self, *args, **kwargs):
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args, **kwargs)
+            self.reused += 1
+        else:
+            obj = self.cls(*args, **kwargs)
+            self.created += 1
+        return obj
+
+    def release(self, obj):
+        if len(self.free) < self.max_size:
+            self.free.append(obj)
+            self.released += 1
+
+    def release_all(self, objects):
+        """Release all the objects of the list and empty it."""
+        room = self.max_size - len(self.free)
+        self.free.extend(objects[:room])
+        self.released += min(room, len(objects))
+        objects.clear()
+
+
+POOLS = []  # type: List[Pool]
+COLLISIONS = Pool(CollisionData)
 
 
 def clamp(x, mini=float('-inf'), maxi=float('inf')):
@@ -43,87 +109,57 @@ def clamp(x, mini=float('-inf'), maxi=float('inf')):
     return x
 
 
-class Pos:
-    """A vector."""
-
-    def __init__(self, *args):
-        if len(args) == 1:
-            args = args[0]
-        self.x = args[0]
-        self.y = args[1]
+class Pos(pygame.math.Vector2):
+    """
+    A vector.
 
-    def __len__(self):
-        return 2
+    The operators are the ones of pygame's Vector2, in C, and they keep the class. The coordinates are floats,
+    use ti when integers are needed. Beware that +=, -=... modify the vector in place and that the product of
+    two vectors is their dot product.
+    """
 
-    def __iter__(self):
-        yield self.x
-        yield self.y
+    __slots__ = ()
 
     def __bool__(self):
         return bool(self.x and self.y)
 
+    # Vector2 compares with a tolerance
     def __eq__(self, other):
         return self.x == other[0] and self.y == other[1]
 
+    def __ne__(self, other):
+        return not self == other
+
     def __repr__(self):
         return f"Pos({round(self.x, 3)}, {round(self.y, 3)})"
 
-    def __getitem__(self, item):
-        if item == 0:
-            return self.x
-        elif item == 1:
-            return self.y
-        raise IndexError(f"Pos has no item {item}")
-
-    def __add__(self, other):
-        return Pos(self[0] + other[0], self[1] + other[1])
-
-    def __radd__(self, other):
-        return Pos(self.x + other[0], self.y + other[1])
-
-    def __sub__(self, other):
-        return Pos(self[0] - other[0], self[1] - other[1])
-
-    def __rsub__(self, other):
-        return Pos(other[0] - self[0], other[1] - self[1])
-
-    def __neg__(self):
-        return Pos(-self[0], -self[1])
-
-    def __mul__(self, other):
-        return Pos(self[0] * other, self[1] * other)
-
-    def __rmul__(self, other):
-        return Pos(self.x * other, self.y * other)
-
-    def __truediv__(self, other: float):
-        return Pos(self[0] / other, self[1] / other)
+    __str__ = __repr__
 
     def __floordiv__(self, other: float):
-        return Pos(self[0] // other, self[1] // other)
+        return Pos(self.x // other, self.y // other)
 
     @property
     def t(self):
         """The vector as a tuple"""
-        return self[0], self[1]
+        return self.x, self.y
 
     @property
     def ti(self):
         """The vector as a tuple of integer (round to closest)"""
-        return round(self[0]), round(self[1])
+        return round(self.x), round(self.y)
 
     @property
     def i(self):
-        """The vector as an integer Pos (round to closest)"""
-        return Pos(round(self[0]), round(self[1]))
+        """The vector rounded to the closest integers"""
+        return Pos(round(self.x), round(self.y))
 
     def squared_norm(self):
         """Return the squared norm of the vector"""
-        return self[0] ** 2 + self[1] ** 2
+        return self.length_squared()
 
     def norm(self):
         """Return the norm of the vector"""
-        return sqrt(self.squared_norm())
+        return self.length()
 
     def normalise(self):
         return self / self.norm()
@@ -131,8 +167,8 @@ class Pos:
     def rotate(self, degree):
         c = cos(pi / 180 * degree)
         s = sin(pi / 180 * degree)
-        return Pos(c * self[0] + s * self[1],
-                   s * self[0] - c * self[1])
+        x, y = self
+        return Pos(c * x + s * y, s * x - c * y)
 
     def __reversed__(self):
         return Pos(self.y, self.x)
@@ -165,6 +201,8 @@ class Pos:
 class AABB:
     """Axis aligned rectangle: the basic shape."""
 
+    __slots__ = ("topleft", "size")
+
     def __init__(self, *args):
         """Create a axis aligned rectangle. Args a in the same style as pygame.Rect args."""
         if len(args) == 1:
@@ -273,23 +311,19 @@ class AABB:
         surf.fill((0, 0, 255), rect)
 
 
-class AASegment(AABB):
-    def __init__(self, start, end, pos, vertical=False):
-        """
-        The start and end position are the x or y coordinate depending wheter the segment is vertical or not.
-        pos is the other (shared) coordinate.
-        """
-
-        self.vertical = vertical
-        if self.vertical:
-            super().__init__((pos, min(start, end)), (1, abs(start - end)))
-        else:
-            super().__init__((min(start, end), pos), (abs(start - end), 1))
-
-
 class Body:
     """A moving object."""
 
+    collision_mask = Layer.PICKUP | Layer.DEADLY
+    swept = False
+    """Check the blocks along the whole motion of each tick and not only where the body ends, so it can't go
+    through a block even faster than a block per tick (continuous collision detection)."""
+
+    # the subclasses with more state (like the Player) have a __dict__ too
+    __slots__ = ("dead", "sleep", "elasticity", "mass", "shape", "space", "velocity", "max_velocity", "acceleration",
+                 "collide_left", "collide_down", "collide_right", "collide_top",
+                 "last_collide_left", "last_collide_down", "last_collide_right", "last_collide_top", "collisions")
+
     def __init__(self, shape, mass=1, elasticity=0, max_velocity=(None, None), space=None):
 
         # LOGGER.debug(f"Creating Body. shape = {shape}, mass = {mass}, elasticity = {elasticity}")
@@ -303,7 +337,7 @@ class Body:
         self.space = space  # type: Space
 
         self.velocity = Pos(0, 0)
-        self.max_velocity = Pos(max_velocity)
+        self.max_velocity = tuple(max_velocity)  # None for no limit on an axis
         self.acceleration = Pos(0, 0)
 
         self.collide_left = False
@@ -333,76 +367,112 @@ class Body:
     def center(self, value):
         self.shape.center = value
 
-    def update_x(self, tiles):
-        """Updates the position on the x coordinate and check for collision with the shapes."""
+    def update_x(self, tile_map):
+        """Updates the position on the x coordinate and check for collision with the solid blocks of the map."""
 
         self.velocity.x += self.acceleration.x
         self.clamp_speed()
+        start = self.shape.x if self.swept else None
         self.shape.x += self.velocity.x
 
-        intersect = [s for s in tiles if self.shape.collide(s)]
-
+        size = tile_map.DEFAULT_BLOCK_SIZE
         if self.velocity.x > 0:
             # we are going right
-            for aabb in intersect:
-                if aabb.left < self.shape.right:
-                    self.shape.right = aabb.left
+            for cell in self.touched_cells(tile_map, 0, False, start):
+                if cell[0] * size < self.shape.right:
+                    self.shape.right = cell[0] * size
                     self.velocity.x *= -self.elasticity
-
-                    colli = CollisionData(CollisionType.BLOCK, tiles[aabb], shape=aabb)
-                    self.collisions.append(colli)
+                    self.add_block_collision(tile_map, cell)
         elif self.velocity.x < 0:
             # we are going left
-            for aabb in intersect:
-                if self.shape.left < aabb.right:
-                    self.shape.left = aabb.right
+            for cell in self.touched_cells(tile_map, 0, True, start):
+                if self.shape.left < (cell[0] + 1) * size:
+                    self.shape.left = (cell[0] + 1) * size
                     self.velocity.x *= -self.elasticity
-
-                    colli = CollisionData(CollisionType.BLOCK, tiles[aabb], shape=aabb)
-                    self.collisions.append(colli)
+                    self.add_block_collision(tile_map, cell)
 
         self.acceleration.x = 0
 
-    def update_y(self, tiles):
+    def update_y(self, tile_map):
         self.velocity.y += self.acceleration.y
         self.clamp_speed()
+        start = self.shape.y if self.swept else None
         self.shape.y += self.velocity.y
 
-        intersect = [s for s in tiles if self.shape.collide(s)]
-
+        size = tile_map.DEFAULT_BLOCK_SIZE
         if self.velocity.y > 0:
             # we are going down
-            for aabb in intersect:
-                if self.shape.bottom > aabb.top:
-                    self.shape.bottom = aabb.top
+            for cell in self.touched_cells(tile_map, 1, False, start):
+                if self.shape.bottom > cell[1] * size:
+                    self.shape.bottom = cell[1] * size
                     self.velocity.y *= -self.elasticity
-                    colli = CollisionData(CollisionType.BLOCK, tiles[aabb], shape=aabb)
-                    self.collisions.append(colli)
-
+                    self.add_block_collision(tile_map, cell)
         elif self.velocity.y < 0:
             # we are going up
-            for aabb in intersect:
-                if aabb.bottom > self.shape.top:
-                    self.shape.top = aabb.bottom
+            for cell in self.touched_cells(tile_map, 1, True, start):
+                if (cell[1] + 1) * size > self.shape.top:
+                    self.shape.top = (cell[1] + 1) * size
                     self.velocity.y *= -self.elasticity
-                    colli = CollisionData(CollisionType.BLOCK, tiles[aabb], shape=aabb)
-                    self.collisions.append(colli)
+                    self.add_block_collision(tile_map, cell)
 
         self.acceleration.y = 0
 
+    def touched_cells(self, tile_map, axis, backward, start=None):
+        """
+        Return the solid cells the body can be pushed out of along the axis (0 for x), sorted by column then line.
+
+        Moving forward, only the first cell of each collider overlapping the body can stop it. Moving
+        backward, each column (or line) of the collider pushes it further, so they are all kept and
+        the collisions are the same as when checking the blocks one by one.
+
+        If the start of the move is given (the x or y of the body before it), the whole motion is checked
+        and only the cells nearest to the start along the axis are returned: the body stops against them
+        and never reaches the ones behind.
+        """
+
+        size = tile_map.DEFAULT_BLOCK_SIZE
+        bounds = [self.shape.left, self.shape.top, self.shape.right, self.shape.bottom]
+        if start is not None:
+            # extend the body back to where it started the move
+            length = bounds[axis + 2] - bounds[axis]
+            bounds[axis] = min(bounds[axis], start)
+            bounds[axis + 2] = max(bounds[axis + 2], start + length)
+        left, top, right, bottom = bounds
+        first_cell = (int(left // size), int(top // size))
+        end = (int(-(-right // size)), int(-(-bottom // size)))
+
+        cells = []
+        for collider in tile_map.colliders_in(left, top, right, bottom):
+            first = [max(collider[0], first_cell[0]), max(collider[1], first_cell[1])]
+            cells.append(tuple(first))
+            if backward:
+                for i in range(first[axis] + 1, min(collider[axis + 2], end[axis])):
+                    first[axis] = i
+                    cells.append(tuple(first))
+        if start is not None and cells:
+            nearest = max(cell[axis] for cell in cells) if backward else min(cell[axis] for cell in cells)
+            cells = [cell for cell in cells if cell[axis] == nearest]
+        cells.sort()
+        return cells
+
+    def add_block_collision(self, tile_map, map_pos):
+        shape = AABB(tile_map.get_block_world_rect(map_pos))
+        self.collisions.append(COLLISIONS.acquire(CollisionType.BLOCK, tile_map.get_block(map_pos), shape))
+
     def check_collisions(self, projectiles):
         for proj in projectiles:
             if self.shape.collide(proj.shape):
-                proj_coli = CollisionData(CollisionType.BODY, self, self.shape)
-                self_coli = CollisionData(CollisionType.PROJECTILE, proj, proj.shape)
-                self.collisions.append(self_coli)
-                proj.collisions.append(proj_coli)
+                self.collisions.append(COLLISIONS.acquire(CollisionType.PROJECTILE, proj, proj.shape))
+                # the views of a ProjectileArray are made for each query, nobody would see their collisions
+                if not isinstance(proj, ProjectileView):
+                    proj.collisions.append(COLLISIONS.acquire(CollisionType.BODY, self, self.shape))
 
     def clamp_speed(self):
-        if self.max_velocity.x is not None:
-            self.velocity.x = clamp(self.velocity.x, -self.max_velocity.x, self.max_velocity.x)
-        if self.max_velocity.y is not None:
-            self.velocity.y = clamp(self.velocity.y, -self.max_velocity.y, self.max_velocity.y)
+        max_x, max_y = self.max_velocity
+        if max_x is not None:
+            self.velocity.x = clamp(self.velocity.x, -max_x, max_x)
+        if max_y is not None:
+            self.velocity.y = clamp(self.velocity.y, -max_y, max_y)
 
     def apply_force(self, force=(0, 0)):
         """
@@ -416,16 +486,13 @@ class Body:
         else:
             self.acceleration += Pos(force) / self.mass
 
-    def update_sensors(self, shapes):
-        left = AASegment(self.shape.top, self.shape.bottom, self.shape.left - 1, vertical=True)
-        right = AASegment(self.shape.top, self.shape.bottom, self.shape.right + 1, vertical=True)
-        top = AASegment(self.shape.left, self.shape.right, self.shape.top - 1, vertical=False)
-        bottom = AASegment(self.shape.left, self.shape.right, self.shape.bottom + 1, vertical=False)
+    def update_sensors(self, tile_map):
+        left, top, right, bottom = self.shape.left, self.shape.top, self.shape.right, self.shape.bottom
 
-        self.collide_left = any(left.collide(s) for s in shapes)
-        self.collide_right = any(right.collide(s) for s in shapes)
-        self.collide_down = any(bottom.collide(s) for s in shapes)
-        self.collide_top = any(top.collide(s) for s in shapes)
+        self.collide_left = bool(tile_map.colliders_in(left - 1, top, left, bottom))
+        self.collide_right = bool(tile_map.colliders_in(right + 1, top, right + 2, bottom))
+        self.collide_down = bool(tile_map.colliders_in(left, bottom + 1, right, bottom + 2))
+        self.collide_top = bool(tile_map.colliders_in(left, top - 1, right, top))
 
     def update_history(self):
         self.last_collide_top += 1
@@ -447,6 +514,18 @@ class Body:
 
         pass
 
+    def snapshot(self):
+        """
+        Copy the state of the body, to put it back later with restore.
+
+        The space and the collisions are not part of it, as they reference other objects.
+        """
+        return copy_state({name: value for name, value in get_state(self).items()
+                           if name not in ("space", "collisions")})
+
+    def restore(self, state):
+        set_state(self, copy_state(state))
+
     def render(self, surf, offset=(0, 0)):
         pass
 
@@ -455,6 +534,19 @@ class Body:
         (10 * self.velocity).debug_draw(surf, offset, self.center)
 
 
+def copy_state(state):
+    """Copy the mutable values of a state dict (vectors, shapes, lists), the rest is shared."""
+    state = dict(state)
+    for name, value in state.items():
+        if isinstance(value, AABB):
+            state[name] = AABB(value)
+        elif isinstance(value, Pos):
+            state[name] = Pos(value)
+        elif isinstance(value, list):
+            state[name] = value[:]
+    return state
+
+
 class Projectile(Body):
     """
     Not necessarily a bullet, but any collectible/brochette...
@@ -464,12 +556,380 @@ class Projectile(Body):
     """
 
     deadly = False
+    layer = Layer.PICKUP
+
+    __slots__ = ()
 
-    def update_sensors(self, shapes):
+    def update_sensors(self, tile_map):
         # don't care about sensors
         pass
 
 
+class ProjectileView:
+    """
+    A copy of one projectile of a ProjectileArray, so it can be seen like a Projectile:
+    in the collisions of the bodies, or to render it.
+    """
+
+    deadly = False
+    layer = Layer.PICKUP
+
+    __slots__ = ("shape", "velocity", "rotation", "variant", "ttl", "sleep", "collisions")
+
+    def __init__(self, shape, velocity, rotation=0, variant=0, ttl=0, sleep=False):
+        self.shape = shape
+        self.velocity = velocity
+        self.rotation = rotation
+        self.variant = variant
+        self.ttl = ttl
+        self.sleep = sleep
+        self.collisions = []  # type: List[CollisionData]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: s {self.shape}, v {self.velocity}>"
+
+    @property
+    def topleft(self):
+        return self.shape.topleft
+
+    def render(self, surf, offset=(0, 0)):
+        pass
+
+
+class ProjectileArray:
+    """
+    Many projectiles stored in numpy arrays (one per attribute) and updated all at once.
+
+    They fly in straight line along an axis, without gravity, fall asleep when they hit
+    a solid block and disappear ttl ticks later, like a Projectile would in the Space.
+    As the blocks do not move, where and when they hit is known as soon as they are added,
+    so their position is just computed from their age.
+    Bodies see them through views of the view_class.
+    """
+
+    FIELDS = ("pos", "size", "velocity", "rotation", "variant", "ttl", "sleep", "hit",
+              "origin", "age", "impact_age", "impact")
+    NEVER = -1  # impact age of the projectiles that do not move
+
+    def __init__(self, view_class=ProjectileView, ttl=30, elasticity=0, capacity=64):
+        self.view_class = view_class
+        self.layer = view_class.layer
+        self.ttl_after_hit = ttl
+        self.elasticity = elasticity
+        self.space = None  # type: Space
+        self.impacts = {}  # (pos, size, velocity) -> (impact age, impact pos), valid while the map doesn't change
+
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.size = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.rotation = np.zeros(capacity, dtype=np.int32)
+        self.variant = np.zeros(capacity, dtype=np.int32)
+        self.ttl = np.zeros(capacity, dtype=np.int32)
+        self.sleep = np.zeros(capacity, dtype=bool)
+        self.hit = np.zeros(capacity, dtype=bool)  # hit a solid block during the last tick
+        self.origin = np.zeros((capacity, 2))  # position when added
+        self.age = np.zeros(capacity, dtype=np.int32)  # ticks since added
+        self.impact_age = np.zeros(capacity, dtype=np.int32)  # age when it hits a block
+        self.impact = np.zeros((capacity, 2))  # position when it hits a block
+
+    def __len__(self):
+        return self.count
+
+    def add(self, pos, size, velocity, rotation=0, variant=0, age=0):
+        """Add a projectile, already simulated for age ticks. It must not have disappeared by then."""
+
+        if age:
+            lifetime = self.lifetime(tuple(pos), tuple(size), tuple(velocity))
+            if lifetime is not None and age >= lifetime:
+                raise ValueError(f"A projectile added {age} ticks late is already gone, it lives {lifetime} ticks")
+
+        if self.count == len(self.pos):
+            self.resize(2 * len(self.pos))
+
+        i = self.count
+        self.pos[i] = pos
+        self.size[i] = size
+        self.velocity[i] = velocity
+        self.rotation[i] = rotation
+        self.variant[i] = variant
+        self.ttl[i] = self.ttl_after_hit
+        self.sleep[i] = False
+        self.hit[i] = False
+        self.origin[i] = pos
+        self.age[i] = 0
+        self.impact_age[i], self.impact[i] = self.find_impact(tuple(pos), tuple(size), tuple(velocity))
+        self.count += 1
+
+        if not age:
+            return
+        impact_age = self.impact_age[i]
+        if impact_age == self.NEVER or age < impact_age:
+            self.age[i] = age
+            self.pos[i] = self.origin[i] + self.velocity[i] * age
+            return
+        # what simulate does to it once it hit a block
+        self.age[i] = impact_age
+        self.pos[i] = self.impact[i]
+        self.velocity[i] *= -self.elasticity
+        if age == impact_age:
+            self.hit[i] = True
+        else:
+            self.sleep[i] = True
+            self.ttl[i] -= age - impact_age
+
+    def resize(self, capacity):
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def clear(self):
+        self.count = 0
+
+    def keep(self, mask):
+        """Remove the projectiles where mask is False, the others stay in the same order."""
+        kept = int(mask.sum())
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            array[:kept] = array[:self.count][mask]
+        self.count = kept
+
+    def view(self, i, pos=None):
+        pos = self.pos[i] if pos is None else pos
+        return self.view_class(AABB(pos.tolist(), self.size[i].tolist()), Pos(self.velocity[i].tolist()),
+                               int(self.rotation[i]), int(self.variant[i]), int(self.ttl[i]), bool(self.sleep[i]))
+
+    def views(self, alpha=1.0):
+        """Views of all the projectiles, drawn alpha of the way from their previous position, see interpolate."""
+        pos = self.interpolate(alpha)
+        return [self.view(i, pos[i]) for i in range(self.count)]
+
+    def interpolate(self, alpha):
+        """
+        Positions of the projectiles alpha of the way between the last tick and the current one.
+
+        They come from the age, like in simulate. Those that just hit or sleep are where they are.
+        """
+
+        n = self.count
+        if alpha >= 1:
+            return self.pos[:n]
+        flying = ~self.sleep[:n] & ~self.hit[:n]
+        pos = self.pos[:n].copy()
+        age = np.maximum(self.age[:n][flying] - 1 + alpha, 0)
+        pos[flying] = self.origin[:n][flying] + self.velocity[:n][flying] * age[:, None]
+        return pos
+
+    def moving(self):
+        """Whether some projectiles were still flying during the last tick."""
+        n = self.count
+        return bool((~self.sleep[:n] & ~self.hit[:n] & self.velocity[:n].any(axis=1)).any())
+
+    def find_impact(self, pos, size, velocity):
+        """
+        Return the age at which a projectile hits a solid block and its position then.
+
+        This is a raycast on the grid, along the columns (or lines) in front of the projectile,
+        that gives the same result as moving it one tick at a time like Body.update_x/update_y.
+        The result is cached, as the emitters always add their projectiles at the same place.
+        """
+
+        key = pos, size, velocity
+        if key in self.impacts:
+            return self.impacts[key]
+
+        if velocity[0] and velocity[1]:
+            raise ValueError(f"Projectiles of a ProjectileArray move along an axis, not {velocity}")
+        if not velocity[0] and not velocity[1]:
+            self.impacts[key] = self.NEVER, pos
+            return self.impacts[key]
+
+        tile_map = self.space.tile_map
+        block_size = tile_map.DEFAULT_BLOCK_SIZE
+        solid = tile_map.solid_array  # with a solid border, so the cells outside the map are solid
+        axis = 0 if velocity[0] else 1
+        start, length, speed = pos[axis], size[axis], velocity[axis]
+
+        # The lines (for a move along x) covered by the projectile never change, so a column
+        # blocks it if any of those lines is solid. Clipped lines go in the solid border.
+        other_start = int(pos[1 - axis] // block_size)
+        other_end = int(-(-(pos[1 - axis] + size[1 - axis]) // block_size))
+        other_size = solid.shape[axis] - 2
+        band = slice(min(max(other_start, -1), other_size) + 1, max(min(other_end, other_size + 1), 0) + 1)
+        if axis == 0:
+            blocking = solid[band].any(axis=0)
+        else:
+            blocking = solid[:, band].any(axis=1)
+        cells = len(blocking) - 2
+
+        def enters(age):
+            """Whether the projectile reached the cell at this age."""
+            position = start + speed * age
+            if speed > 0:
+                return position + length > cell * block_size
+            return position < (cell + 1) * block_size
+
+        def overlaps(age):
+            position = start + speed * age
+            return cell * block_size < position + length and position < (cell + 1) * block_size
+
+        step = 1 if speed > 0 else -1
+        cell = int(start // block_size) if speed > 0 else int(-(-(start + length) // block_size)) - 1
+        while True:
+            if 0 <= cell < cells and not blocking[cell + 1]:
+                cell += step
+                continue
+
+            if speed > 0:
+                age = max(1, int((cell * block_size - start - length) // speed) + 1)
+            else:
+                age = max(1, int((start - (cell + 1) * block_size) // -speed) + 1)
+            while age > 1 and enters(age - 1):
+                age -= 1
+            while not enters(age):
+                age += 1
+
+            if overlaps(age):
+                impact = list(pos)
+                impact[axis] = cell * block_size - length if speed > 0 else (cell + 1) * block_size
+                self.impacts[key] = age, tuple(impact)
+                return self.impacts[key]
+
+            # it went past the cell in one tick
+            cell += step
+
+    def lifetime(self, pos, size, velocity):
+        """Number of ticks a projectile added with those stays in the array, None if it never hits anything."""
+
+        impact_age, _ = self.find_impact(pos, size, velocity)
+        if impact_age == self.NEVER:
+            return None
+        return impact_age + self.ttl_after_hit
+
+    def simulate(self):
+        """Advance all the projectiles of one tick."""
+
+        # what Projectile.internal_logic does for brochettes
+        n = self.count
+        sleep = self.sleep[:n]
+        sleep |= self.hit[:n]
+        self.ttl[:n][sleep] -= 1
+        alive = self.ttl[:n] > 0
+        if not alive.all():
+            self.keep(alive)
+            n = self.count
+
+        awake = ~self.sleep[:n]
+        age = self.age[:n]
+        age += awake
+        hit = self.hit[:n]
+        hit[:] = awake & (age == self.impact_age[:n])
+        flying = awake & ~hit
+
+        self.pos[:n][flying] = self.origin[:n][flying] + self.velocity[:n][flying] * age[flying, None]
+        self.pos[:n][hit] = self.impact[:n][hit]
+        self.velocity[:n][hit] *= -self.elasticity
+
+    def colliding(self, shape):
+        """Views of the awake projectiles that collide with the shape."""
+
+        n = self.count
+        left, top = self.pos[:n].T
+        width, height = self.size[:n].T
+        colliding = ((~self.sleep[:n])
+                     & (left < shape.right) & (shape.left < left + width)
+                     & (top < shape.bottom) & (shape.top < top + height))
+        return [self.view(i) for i in np.flatnonzero(colliding)]
+
+    def snapshot(self):
+        return {name: getattr(self, name)[:self.count].copy() for name in self.FIELDS}
+
+    def restore(self, state):
+        self.count = 0
+        self.resize(max(len(self.pos), len(state["pos"])))
+        for name, array in state.items():
+            getattr(self, name)[:len(array)] = array
+        self.count = len(state["pos"])
+
+
+class SpatialHash:
+    """
+    Uniform grid over the world, each cell knowing the bodies that overlap it.
+
+    Finding the bodies that may touch a shape only looks at the few cells it covers,
+    not at every body of the space. The bodies are moved to other cells only when they cross a border.
+    """
+
+    def __init__(self, cell_size=2 * DEFAULT_BLOCK_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # type: Dict[Tuple[int, int], Dict[Body, int]]  # cell -> {body: insertion number}
+        self.bounds = {}  # type: Dict[Body, Tuple[int, int, int, int]]  # body -> cells covered, inclusive
+        self.inserted = 0
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, body):
+        return body in self.bounds
+
+    def cell_bounds(self, shape):
+        size = self.cell_size
+        return int(shape.left // size), int(shape.top // size), int(shape.right // size), int(shape.bottom // size)
+
+    def update(self, body):
+        """Add the body or move it to the cells of its current shape."""
+
+        bounds = self.cell_bounds(body.shape)
+        old_bounds = self.bounds.get(body)
+        if bounds == old_bounds:
+            return
+
+        if old_bounds is None:
+            number = self.inserted
+            self.inserted += 1
+        else:
+            number = self.unlink(body, old_bounds)
+
+        self.bounds[body] = bounds
+        left, top, right, bottom = bounds
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                self.cells.setdefault((x, y), {})[body] = number
+
+    def remove(self, body):
+        bounds = self.bounds.pop(body, None)
+        if bounds is not None:
+            self.unlink(body, bounds)
+
+    def unlink(self, body, bounds):
+        """Remove the body from the cells and return its insertion number."""
+
+        number = None
+        left, top, right, bottom = bounds
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                cell = self.cells[x, y]
+                number = cell.pop(body)
+                if not cell:
+                    del self.cells[x, y]
+        return number
+
+    def query(self, shape, layers=Layer.PICKUP | Layer.DEADLY):
+        """Return the bodies in the layers that share a cell with the shape, in the order they were added."""
+
+        found = {}
+        left, top, right, bottom = self.cell_bounds(shape)
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                cell = self.cells.get((x, y))
+                if cell:
+                    found.update(cell)
+
+        return [body for body in sorted(found, key=found.get) if body.layer & layers]
+
+
 class Space:
     def __init__(self, tile_map=None, gravity=(0, 0)):
         self.projectiles = []  # type: List[Projectile]
@@ -477,6 +937,8 @@ class Space:
         self.gravity = Pos(gravity)
         self.static_bodies = []  # type: List[AABB]
         self.moving_bodies = []  # type: List[Body]
+        self.projectile_hash = SpatialHash()  # the projectiles that are not sleeping
+        self.projectile_arrays = []  # type: List[ProjectileArray]
 
     def add(self, *bodies):
         for body in bodies:
@@ -484,38 +946,51 @@ class Space:
 
             if isinstance(body, Projectile):
                 self.projectiles.append(body)
+                if not body.sleep:
+                    self.projectile_hash.update(body)
+            elif isinstance(body, ProjectileArray):
+                self.projectile_arrays.append(body)
             elif isinstance(body, Body):
                 self.moving_bodies.append(body)
             else:
                 self.static_bodies.append(body)
             body.space = self
 
-    def possible_collision_for(self, body):
-        tl = self.tile_map.world_to_map(body.topleft)
-        br = self.tile_map.world_to_map(body.topleft + body.shape.size)
-        d = {}
-        for x in range(tl[0] - 1, br[0] + 2):
-            for y in range(tl[1] - 1, br[1] + 2):
-                block = self.tile_map.get_block((x, y))
-                if block.solid:
-                    rect = AABB(self.tile_map.get_block_world_rect((x, y)))
-                    d[rect] = block
-        return d
+    def remove(self, body):
+        if isinstance(body, Projectile):
+            self.projectiles.remove(body)
+            self.projectile_hash.remove(body)
+        elif isinstance(body, ProjectileArray):
+            self.projectile_arrays.remove(body)
+        elif isinstance(body, Body):
+            self.moving_bodies.remove(body)
+        else:
+            self.static_bodies.remove(body)
 
     def simulate(self):
         # first we update/move all projectiles
-        for proj in self.projectiles[:]:
+        projectile_hash = self.projectile_hash
+        dead = False
+        for proj in self.projectiles:
             proj.internal_logic()
             if proj.dead:
-                self.projectiles.remove(proj)
+                projectile_hash.remove(proj)
+                dead = True
             elif proj.sleep:
-                pass
+                # sleeping projectiles collide with nothing, they are just waiting to disappear
+                projectile_hash.remove(proj)
             else:
-                proj.collisions.clear()
+                COLLISIONS.release_all(proj.collisions)
                 if proj.mass:
                     proj.apply_force(self.gravity)
-                proj.update_x(self.possible_collision_for(proj))
-                proj.update_y(self.possible_collision_for(proj))
+                proj.update_x(self.tile_map)
+                proj.update_y(self.tile_map)
+                projectile_hash.update(proj)
+        if dead:
+            self.projectiles[:] = [proj for proj in self.projectiles if not proj.dead]
+
+        for array in self.projectile_arrays:
+            array.simulate()
 
         for body in self.moving_bodies[:]:
             body.internal_logic()
@@ -524,23 +999,30 @@ class Space:
             elif body.sleep:
                 pass
             else:
-                body.collisions.clear()
+                COLLISIONS.release_all(body.collisions)
                 if body.mass:
                     body.apply_force(self.gravity)
 
                 # check collision horizontally
                 # we don't do both at the same time because it simplifies A LOT the thing
                 # plus it's accurate enough
-                body.update_x(self.possible_collision_for(body))
-                body.update_y(self.possible_collision_for(body))
+                body.update_x(self.tile_map)
+                body.update_y(self.tile_map)
 
-                # we check for collisions with projectiles
-                body.check_collisions([proj for proj in self.projectiles if not proj.sleep])
+                # we check for collisions with the projectiles nearby
+                projectiles = projectile_hash.query(body.shape, body.collision_mask)
+                for array in self.projectile_arrays:
+                    if array.layer & body.collision_mask:
+                        projectiles.extend(array.colliding(body.shape))
+                body.check_collisions(projectiles)
 
                 # Finally we check if we are grounded/against a wall...
-                body.update_sensors(self.possible_collision_for(body))
+                body.update_sensors(self.tile_map)
                 body.update_history()
 
     def debug_draw(self, surf, offset=(0, 0)):
         for body in self.moving_bodies + self.projectiles:
             body.debug_draw(surf, offset)
+        for array in self.projectile_arrays:
+            for proj in array.views():
+                proj.shape.debug_draw(surf, offset)
@@ -1,5 +1,6 @@
 import os
 from enum import Enum, auto
+from functools import lru_cache
 import pygame
 import logging
 
@@ -28,6 +29,15 @@ MAX_WALL_VELOCITY = 5
 WALL_STICKY_FRAMES = 15
 
 
+@lru_cache()
+def get_player_imgs(player, size):
+    """Return the images of the player looking right and left."""
+    img = pygame.image.load(os.path.join(PLAYER_FOLDER, PLAYERS[player][0])).convert()
+    img.set_colorkey((255, 0, 255))
+    img = pygame.transform.scale(img, size)
+    return img, pygame.transform.flip(img, True, False)
+
+
 class State(Enum):
     STILL = auto()
     WALK = auto()
@@ -40,6 +50,8 @@ class State(Enum):
 
 
 class Player(Body):
+    swept = True
+
     def __init__(self, start_pos=(0, 0), respawn=False):
         LOGGER.info(f"Started initializing a player at pos {start_pos}. Respawning? {respawn}")
         size = (76 * 3 // 4, 70 * 3 // 4)
@@ -47,10 +59,7 @@ class Player(Body):
         super().__init__(shape, max_velocity=(16, 16))
         self.visible = True
 
-        self.img = pygame.image.load(os.path.join(PLAYER_FOLDER, PLAYERS[CONFIG.player][0])).convert()
-        self.img.set_colorkey((255, 0, 255))
-        self.img = pygame.transform.scale(self.img, size)
-        self.img_left = pygame.transform.flip(self.img, True, False)
+        self.img, self.img_left = get_player_imgs(CONFIG.player, size)
 
         self.directions = [False, False]  # [Left, Right]
         self.jumping = False
@@ -258,4 +267,4 @@ class Player(Body):
                     self.space.tile_map.reset()
                 elif block.character == 'E':
                     LOGGER.info(f"Player hit end block.")
-                    self.space.tile_map.explode(block.pos)
+                    self.space.tile_map.explode(self.space.tile_map.world_to_map(colli.shape.topleft))
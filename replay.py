@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Record the inputs of a run on a level and play them back.
+
+A replay stores which bindings are pressed each time it changes, so the same
+run can be played again without window and as fast as possible, to reproduce
+a bug deterministically or to profile the game logic on a real run.
+
+The runs are recorded when `record_replays` is set in the config, and saved in
+the replays folder when the level is finished. To play one back:
+
+    ./replay.py assets/replays/7-20261018-142512.replay --seek 3000
+"""
+import os
+import json
+import logging
+import zlib
+from time import perf_counter, strftime
+import click
+import pygame
+
+from config import CONFIG
+from constants import MAPS_FOLDER, REPLAYS_FOLDER, VERSION
+from level import Level
+from simulation import Simulation
+
+LOGGER = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+SCREEN_SIZE = (1600, 1008)
+BINDINGS = ("left", "right", "jump", "run")  # binding i is the bit 1 << i of the masks
+CHECKSUM_INTERVAL = 60  # ticks between two checksums stored in the replay
+KEYFRAME_INTERVAL = 600  # ticks between two snapshots kept by the runner to seek
+
+
+def map_crc(path):
+    with open(path, "rb") as f:
+        return zlib.crc32(f.read())
+
+
+class Replay:
+    def __init__(self, num, map_name, crc, ak47_collected=0, inputs=(), checksums=(), ticks=0, version=VERSION):
+        self.num = num
+        self.map_name = map_name  # file in the maps folder
+        self.crc = crc  # of the map file, to know if it changed since the recording
+        self.ak47_collected = ak47_collected  # the AK47 spawns only if it was not already collected
+        self.inputs = list(inputs)  # (tick, mask of the bindings pressed from this tick on)
+        self.checksums = list(checksums)  # state checksum every CHECKSUM_INTERVAL ticks
+        self.ticks = ticks
+        self.version = version  # of the game
+
+        self.mask = self.inputs[-1][1] if self.inputs else 0
+
+    def __str__(self):
+        return f"<Replay: level {self.num}, {self.ticks} ticks, {len(self.inputs)} inputs>"
+
+    @classmethod
+    def for_level(cls, level):
+        """Start an empty recording of a run on the level."""
+        return cls(level.num, os.path.basename(level.path), map_crc(level.path),
+                   CONFIG.levels_stats[str(level.num)][2])
+
+    @property
+    def map_path(self):
+        return os.path.join(MAPS_FOLDER, self.map_name)
+
+    def record(self, tick, event):
+        """Record a key event that happened before the given tick, if it changes the bindings pressed."""
+
+        if event.type not in (pygame.KEYDOWN, pygame.KEYUP):
+            return
+
+        for bit, binding in enumerate(BINDINGS):
+            if event.key == getattr(CONFIG.bindings, binding):
+                if event.type == pygame.KEYDOWN:
+                    mask = self.mask | 1 << bit
+                else:
+                    mask = self.mask & ~(1 << bit)
+
+                if mask != self.mask:
+                    self.inputs.append((tick, mask))
+                    self.mask = mask
+                return
+
+    def record_tick(self, simulation):
+        """Called after each tick of the recorded simulation."""
+        self.ticks = simulation.tick
+        if simulation.tick % CHECKSUM_INTERVAL == 0:
+            self.checksums.append(simulation.checksum())
+
+    def events(self):
+        """Map each tick to the pygame events the player receives before it."""
+
+        events = {}
+        mask = 0
+        for tick, new_mask in self.inputs:
+            changed = mask ^ new_mask
+            for bit, binding in enumerate(BINDINGS):
+                if changed & 1 << bit:
+                    event = pygame.event.Event(pygame.KEYDOWN if new_mask & 1 << bit else pygame.KEYUP,
+                                               key=getattr(CONFIG.bindings, binding))
+                    events.setdefault(tick, []).append(event)
+            mask = new_mask
+        return events
+
+    def save(self, path=None):
+        """Save the replay, by default in the replays folder. Return the path."""
+
+        if path is None:
+            os.makedirs(REPLAYS_FOLDER, exist_ok=True)
+            path = os.path.join(REPLAYS_FOLDER, f"{self.num}-{strftime('%Y%m%d-%H%M%S')}.replay")
+
+        # each input is stored as the number of ticks since the previous one and the new mask
+        inputs = []
+        last_tick = 0
+        for tick, mask in self.inputs:
+            inputs.append((tick - last_tick, mask))
+            last_tick = tick
+
+        d = {
+            "format": FORMAT_VERSION,
+            "version": self.version,
+            "level": self.num,
+            "map": self.map_name,
+            "map_crc": self.crc,
+            "ak47_collected": self.ak47_collected,
+            "ticks": self.ticks,
+            "inputs": inputs,
+            "checksum_interval": CHECKSUM_INTERVAL,
+            "checksums": self.checksums,
+        }
+
+        LOGGER.info("Saving %s to %s", self, path)
+        with open(path, "w") as f:
+            json.dump(d, f, separators=(",", ":"))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            d = json.load(f)
+
+        if d["format"] != FORMAT_VERSION:
+            raise ValueError(f"Unknown replay format {d['format']}, expected {FORMAT_VERSION}")
+        if d["checksum_interval"] != CHECKSUM_INTERVAL:
+            LOGGER.warning("The checksums were taken every %s ticks, they will not be checked.",
+                           d["checksum_interval"])
+            d["checksums"] = []
+
+        inputs = []
+        tick = 0
+        for delta, mask in d["inputs"]:
+            tick += delta
+            inputs.append((tick, mask))
+
+        replay = cls(d["level"], d["map"], d["map_crc"], d["ak47_collected"], inputs, d["checksums"],
+                     d["ticks"], d["version"])
+        LOGGER.info("Loaded %s from %s", replay, path)
+        return replay
+
+
+class ReplayRunner:
+    """Play a replay back, as fast as possible, and go to any tick of it."""
+
+    def __init__(self, replay: Replay, keyframe_interval=KEYFRAME_INTERVAL):
+        self.replay = replay
+        self.keyframe_interval = keyframe_interval
+
+        if replay.version != VERSION:
+            LOGGER.warning("The replay was recorded with version %s of the game, this is %s.", replay.version, VERSION)
+        if map_crc(replay.map_path) != replay.crc:
+            LOGGER.warning("The map %s changed since the replay was recorded.", replay.map_name)
+
+        CONFIG.levels_stats[str(replay.num)][2] = replay.ak47_collected
+        self.simulation = Simulation(Level.load(replay.map_path, replay.num), SCREEN_SIZE)
+        self.simulation.level.num = replay.num
+        self.events = replay.events()
+        self.keyframes = {0: self.simulation.snapshot()}  # tick -> snapshot of the simulation before the tick
+
+    @property
+    def tick(self):
+        return self.simulation.tick
+
+    @property
+    def done(self):
+        return self.tick >= self.replay.ticks or self.simulation.level.over
+
+    def step(self):
+        """Play the inputs of the current tick then advance of one tick."""
+
+        for event in self.events.get(self.tick, ()):
+            self.simulation.update(event)
+        self.simulation.step()
+
+        level = self.simulation.level
+        if (self.tick % self.keyframe_interval == 0 and self.tick not in self.keyframes
+                and not level.exploding and not level.over):
+            self.keyframes[self.tick] = self.simulation.snapshot()
+
+    def check(self):
+        """Whether the state matches the recording, when there is a checksum for the current tick."""
+
+        index = self.tick // CHECKSUM_INTERVAL - 1
+        if self.tick % CHECKSUM_INTERVAL or not 0 <= index < len(self.replay.checksums):
+            return True
+        return self.replay.checksums[index] == self.simulation.checksum()
+
+    def run(self):
+        """Play until the end of the replay. Return the first tick that differs from the recording, or None."""
+
+        diverged = None
+        while not self.done:
+            self.step()
+            if diverged is None and not self.check():
+                LOGGER.warning("Tick %s differs from the recording.", self.tick)
+                diverged = self.tick
+        return diverged
+
+    def seek(self, tick):
+        """Go to the state just before the given tick, starting from the closest keyframe."""
+
+        start = max(t for t in self.keyframes if t <= tick)
+        if self.tick > tick or start > self.tick:
+            self.simulation.restore(self.keyframes[start])
+
+        while self.tick < tick and not self.done:
+            self.step()
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--seek", type=int, help="Go back to this tick after the replay and time it.")
+@click.option("--keyframes", default=KEYFRAME_INTERVAL, help="Number of ticks between two keyframes.")
+def main(path, seek, keyframes):
+    """Play the replay at PATH as fast as possible and check that it matches the recording."""
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    logging.basicConfig(level=logging.WARNING)
+    pygame.init()
+    # needed to load and convert the sprites, but nothing is shown with the dummy driver
+    pygame.display.set_mode(SCREEN_SIZE)
+
+    replay = Replay.load(path)
+    click.echo(f"{replay}, recorded with version {replay.version}")
+
+    runner = ReplayRunner(replay, keyframes)
+    start = perf_counter()
+    diverged = runner.run()
+    total = perf_counter() - start
+
+    click.echo(f"Played {runner.tick} ticks in {total * 1000:.0f}ms ({runner.tick / total:.0f} ticks/s), "
+               f"{runner.simulation.deaths} deaths, {len(runner.keyframes)} keyframes")
+    if diverged is None:
+        click.echo("The run matches the recording.")
+    else:
+        click.echo(f"The run differs from the recording from tick {diverged} on.")
+
+    if seek is not None:
+        start = perf_counter()
+        runner.seek(seek)
+        click.echo(f"Seeked to tick {runner.tick} in {(perf_counter() - start) * 1000:.1f}ms, "
+                   f"checksum {runner.simulation.checksum():08x}")
+
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
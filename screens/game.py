@@ -1,16 +1,17 @@
 import os
 import logging
 import pygame
-from time import time
+from time import time, perf_counter
 
 from graphalama.app import Screen
 from graphalama.colors import ImageBrush
 
 from screens.idle_screen import IdleScreen
-from player import Player
-from level import Level
+from simulation import Simulation, SimulationThread
+from replay import Replay
 from constants import PICKER, LEVELS_GRAPHICAL_FOLDER
 from config import CONFIG, LEVELS
+from pacer import FramePacer
 from physics import Pos
 from screens.widgets import Title, ResumeButton, QuitButton, MenuButton, PauseButton
 
@@ -33,33 +34,37 @@ class PauseScreen(IdleScreen):
         super().__init__(app, widgets, (0, 0, 0))
 
     def update(self, event):
-        self.paused_game.player.update(event)
+        self.paused_game.send_input(event)
         if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
             self.paused_game.resume()
         else:
             super().update(event)
 
     def draw_background(self, display):
+        self.paused_game.moving_rects = None  # our widgets are over the game, it has to be drawn whole
         self.paused_game.render(display)
 
         super().draw_lamas(display)
 
 
 class GameScreen(Screen):
-    FPS = 600
-    UPDATE_FPS = 60
+    MAX_FPS = None  # as many as the display shows, the frames between the ticks are interpolated
+    UPDATE_FPS = Simulation.UPDATE_FPS
+    MAX_CATCH_UP = 5  # ticks run at most in one frame, the game slows down past that instead of spiraling
 
     def __init__(self, app, level):
         LOGGER.info("Entered game screen")
         LOGGER.info(f"Level is {level.num}")
+        # the game keeps running when the window is hidden, it must get enough frames to not lag behind
+        self.pacer = FramePacer(self.MAX_FPS, hidden_fps=self.UPDATE_FPS // self.MAX_CATCH_UP + 1)
         size = Pos(app.display.get_size())
-        self.level = level
-        self.player = Player(self.level.world_start)
-        self.space = self.level.space
-        self.space.add(self.player)
+        self.simulation = Simulation(level, size)
+        if CONFIG.record_replays:
+            self.simulation.recorder = Replay.for_level(level)
+        # with a thread, the ticks keep their pace however long the frames take to draw
+        self.runner = SimulationThread(self.simulation) if CONFIG.threaded_simulation else None
         self.start_time = time()
         self.pause_time = 0
-        self.level.update_offset(self.level.world_start, size)
         self.black_screen = pygame.Surface(app.display.get_size())
         self.black_screen.fill((0, 0, 0))
 
@@ -72,15 +77,43 @@ class GameScreen(Screen):
 
         bg = ImageBrush(bg)
         super().__init__(app, widgets, bg_color=bg)
+        self.background = None  # type: pygame.Surface  # the background painted once, to copy parts of it
+        self.view = None  # (level, camera, screen size) of the last frame
+        self.moving_rects = None  # display rects of what moved or was animated in the last frame
+        self.dirty_rects = None  # parts of the display drawn in the last frame, None for all of it
+        self.last_frame = self.simulation.frame()  # of the last tick, when the ticks run on this thread
+        self.drawn = None  # (tick, alpha) of the last frame drawn
+        self.internal_logic_dt = 0
         self.fade_out_black()
 
         self.last_internal_logic = time()
-        self.internal_logic_dt = 0
+        if self.runner is not None:
+            # baking a chunk takes a few ticks, better before the thread runs than on its first frames
+            self.level.bake_visible_chunks()
+            self.runner.start()
+
+    @property
+    def FPS(self):
+        return self.pacer.fps()
+
+    @property
+    def level(self):
+        return self.simulation.level
+
+    @property
+    def player(self):
+        return self.simulation.player
+
+    @property
+    def space(self):
+        return self.simulation.space
 
     def pause(self):
         """ Pause the game by going into PauseScreen """
         LOGGER.info("Pausing the game by going into PauseScreen")
         self.pause_time = time()
+        if self.runner is not None:
+            self.runner.paused = True
         self.app.set_temp_screen(lambda sm: PauseScreen(sm, self))
 
     def resume(self):
@@ -88,6 +121,9 @@ class GameScreen(Screen):
         LOGGER.info("Resuming the game after a PauseScreen")
         self.app.set_temp_screen(self)
         self.start_time += (time() - self.pause_time)
+        self.moving_rects = None  # the pause screen drew over everything
+        if self.runner is not None:
+            self.runner.paused = False
 
     def update(self, event):
         if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
@@ -96,21 +132,62 @@ class GameScreen(Screen):
         if super().update(event):
             return True
 
-        return self.player.update(event)
+        return self.send_input(event)
+
+    def send_input(self, event):
+        """Pass an input event to the simulation, through the queue of its thread if it has one."""
+        if self.runner is None:
+            return self.simulation.update(event)
+        self.runner.send(event)
+
+    def step(self):
+        """Run one tick of the simulation and keep the frame to draw."""
+        if self.runner is not None:
+            self.runner.step()
+            return
+
+        level = self.level
+        previous = level.positions()
+        self.simulation.step()
+        self.last_frame = self.simulation.frame(previous if self.level is level else None)
+
+    def current_frame(self):
+        """The frame of the last tick, and how far the display is from it to the next one, between 0 and 1."""
+        if self.runner is None:
+            return self.last_frame, min(self.internal_logic_dt * self.UPDATE_FPS, 1)
+        frame = self.runner.frame
+        return frame, min((perf_counter() - frame.time) * self.UPDATE_FPS, 1)
 
     def internal_logic(self):
+        if self.runner is not None:
+            # the thread runs the ticks, but the end and the resets of the level have their fades
+            self.runner.resize(self.app.display.get_size())
+            if self.level.over or self.level.to_reset:
+                self._internal_logic()
+            return
+
         # The goal is to have constant update frame rate -> constant player speed
         self.internal_logic_dt += time() - self.last_internal_logic
         self.last_internal_logic = time()
+        if self.internal_logic_dt > self.MAX_CATCH_UP / self.UPDATE_FPS:
+            LOGGER.debug(f"Dropping {self.internal_logic_dt * self.UPDATE_FPS - self.MAX_CATCH_UP:.1f} ticks late")
+            self.internal_logic_dt = self.MAX_CATCH_UP / self.UPDATE_FPS
 
         while self.internal_logic_dt > 1 / self.UPDATE_FPS:
             self.internal_logic_dt -= 1 / self.UPDATE_FPS
             self._internal_logic()
 
     def _internal_logic(self):
+        if self.runner is None:
+            self.simulation.screen_size = self.app.display.get_size()
         if self.level.over:
             self.fade_in_black()
             LOGGER.info(f"Level is over. Level was {self.level.num}")
+            if self.runner is not None:
+                self.runner.stop()
+            if self.simulation.recorder is not None:
+                self.simulation.recorder.save()
+                self.simulation.recorder = None
             if str(CONFIG.level + 1) in LEVELS:
                 CONFIG.level += 1
             level_stats = CONFIG.levels_stats[str(self.level.num)]
@@ -119,34 +196,55 @@ class GameScreen(Screen):
                 CONFIG.levels_stats[str(self.level.num)][1] = run_time
             self.app.set_screen(PICKER)
         elif self.level.to_reset:
-            LOGGER.info("Level is resetting (it means the player died, in case you weren't aware of that)")
             self.fade_in_black()
-            self.level = Level.load_num(self.level.num)
-            self.player = Player(self.level.world_start, respawn=True)
-            self.space = self.level.space
-            self.space.add(self.player)
-            self.level.update_offset(self.level.world_start, self.app.display.get_size())
+            self.step()
             CONFIG.levels_stats[str(self.level.num)][0] += 1
             self.fade_out_black()
             self.start_time = time()
-        elif self.level.exploding:
-            # Saving run time if best
-            # Actually explode
-            self.level.internal_logic()
         else:
-            self.space.simulate()
-            self.level.update_offset(self.player.center, self.app.display.get_size())
-            self.level.internal_logic()
+            self.step()
 
         fps = round(self.app.clock.get_fps())
-        if fps < 50 and not self.level.to_reset:
+        if fps < 0.8 * self.pacer.current and not self.level.to_reset:
             LOGGER.debug(f"Low FPS: {fps}")
 
     def render(self, surf):
-        self.draw_background(surf)
+        """
+        Draw the game. When the camera did not move, only what moved since the last frame is drawn again.
+
+        The frames between two ticks show the game part of the way from the previous tick to the last one,
+        and are not drawn at all when they would be the same as the last frame.
+        dirty_rects tells then which parts of the display changed, see update_display.
+        """
 
-        self.level.render(surf)
-        self.widgets.render(surf)
+        self.pacer.frame()
+        self.app.drawn_by = self
+        frame, alpha = self.current_frame()
+        if self.moving_rects is not None and self.drawn is not None and self.drawn[0] == frame.tick \
+                and (frame.still or self.drawn[1] == alpha):
+            self.dirty_rects = []
+            return
+        self.drawn = frame.tick, alpha
+
+        view = frame.level, frame.camera(alpha), surf.get_size()
+        if self.moving_rects is None or view != self.view or frame.explosion is not None:
+            if self.background is None or self.background.get_size() != surf.get_size():
+                self.draw_background(surf)
+                self.background = surf.copy()
+            else:
+                surf.blit(self.background, (0, 0))
+            self.moving_rects = frame.render(surf, alpha=alpha)
+            self.widgets.render(surf)
+            self.dirty_rects = None
+        else:
+            # the widgets are drawn again on a clean background, they could be transparent
+            restore = self.moving_rects + [widget.absolute_rect for widget in self.widgets]
+            for rect in restore:
+                surf.blit(self.background, rect, rect)
+            self.moving_rects = frame.render(surf, restore, alpha)
+            self.widgets.render(surf)
+            self.dirty_rects = restore + (self.moving_rects or [])
+        self.view = view
 
         # De-comment to see hitbox
         # self.space.debug_draw(surf, -self.level.offset)
@@ -154,13 +252,24 @@ class GameScreen(Screen):
     def fade_in_black(self):
         for a in range(0, 255, 15):
             self.black_screen.set_alpha(a)
+            self.moving_rects = None  # the black screen covers everything
             self.render(self.app.display)
             self.app.display.blit(self.black_screen, (0, 0))
             pygame.display.flip()
+        self.moving_rects = None
 
     def fade_out_black(self):
         for a in range(255, -1, -15):
             self.black_screen.set_alpha(a)
+            self.moving_rects = None
             self.render(self.app.display)
             self.app.display.blit(self.black_screen, (0, 0))
             pygame.display.flip()
+        self.moving_rects = None
+
+    def update_display(self):
+        """Push what was drawn in the last render to the screen."""
+        if self.dirty_rects is None:
+            pygame.display.flip()
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
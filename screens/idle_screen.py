@@ -10,15 +10,17 @@ from graphalama.core import Widget
 
 from constants import PLAYER_FOLDER
 from config import CONFIG
+from pacer import FramePacer
 
 LOGGER = logging.getLogger(__name__)
 
 
 class IdleScreen(Screen):
-    FPS = 60
+    MAX_FPS = 60
 
     def __init__(self, app, widgets=(), bg_color=None):
         LOGGER.info("Starting an IdleScreen")
+        self.pacer = FramePacer(self.MAX_FPS)
         if bg_color is None:
             bg_color = (0, 0, 0)
         self.lama_logo = pygame.image.load(os.path.join(PLAYER_FOLDER, "lama_normal.png")).convert()
@@ -32,7 +34,90 @@ class IdleScreen(Screen):
                 self.focused_button_index = i
                 break
         super().__init__(app=app, widgets=widgets, bg_color=bg_color)
-    
+        self.changed = True  # whether anything may look different since the last render, see also mark_dirty
+        self.dirty_rects = None  # parts of the display drawn in the last render, None for all of it
+        self.widget_rects = {}  # widget -> display rect it covered in the last render
+
+    @property
+    def FPS(self):
+        return self.pacer.fps(busy=self.changed or bool(self.dirty_widgets()))
+
+    @staticmethod
+    def mark_dirty(*widgets):
+        """Flag the widgets to be drawn again. When only flagged widgets changed, only their rects are drawn."""
+        for widget in widgets:
+            widget.dirty = True
+
+    def dirty_widgets(self):
+        return [widget for widget in self.widgets if widget.animations or getattr(widget, "dirty", False)]
+
+    @staticmethod
+    def covered_rect(widget):
+        """The rect of the display the widget draws on, its shadow included."""
+        if widget.shadow:
+            return widget.absolute_rect.union(widget.shadow_rect)
+        return widget.absolute_rect
+
+    def touched_area(self, rects):
+        """
+        The union of the rects, grown to hold whole the widgets it touches, and those widgets.
+
+        The children of a widget are drawn on subsurfaces, that ignore the clip of the display,
+        so a widget is either drawn whole on a clean background, or not at all.
+        """
+
+        area = rects[0].unionall(rects[1:])
+        grown = True
+        while grown:
+            grown = False
+            for widget in self.widgets:
+                rect = self.covered_rect(widget)
+                if rect.colliderect(area) and not area.contains(rect):
+                    area.union_ip(rect)
+                    grown = True
+        return area, [widget for widget in self.widgets if self.covered_rect(widget).colliderect(area)]
+
+    def render(self, display):
+        """
+        Draw the screen, but only when an event or an animation changed something. It's static otherwise.
+
+        When only some widgets changed (see mark_dirty), only the part of the screen under them is drawn
+        again, where they are now and where they were before.
+        """
+
+        self.pacer.frame()
+        if self.changed:
+            self.changed = False
+            self.dirty_rects = None
+            super().render(display)
+        else:
+            dirty = self.dirty_widgets()
+            if not dirty:
+                self.dirty_rects = []
+                self.app.drawn_by = self
+                return
+            rects = [self.covered_rect(widget) for widget in dirty]
+            rects += [self.widget_rects[widget] for widget in dirty if widget in self.widget_rects]
+            area, touched = self.touched_area(rects)
+            display.set_clip(area)
+            self.draw_background(display)
+            for widget in touched:
+                widget.render(display)
+            display.set_clip(None)
+            self.dirty_rects = [area.clip(display.get_rect())]
+
+        for widget in self.widgets:
+            widget.dirty = False
+            self.widget_rects[widget] = self.covered_rect(widget)
+        self.app.drawn_by = self
+
+    def update_display(self):
+        """Push what was drawn in the last render to the screen."""
+        if self.dirty_rects is None:
+            pygame.display.flip()
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+
     def draw_background(self, display):
         super().draw_background(display)
         self.draw_lamas(display)
@@ -80,6 +165,7 @@ class IdleScreen(Screen):
             LOGGER.warning(f"We somehow lost track of next button :/")
             return
         LOGGER.info(f"Focusing widget {widgets[i]}")
+        IdleScreen.mark_dirty(widgets[i])
         widgets[i].shape.set_border_and_fix_center(2)
         widgets[i].border_color = LLAMA
 
@@ -89,10 +175,27 @@ class IdleScreen(Screen):
             LOGGER.warning("We somehow lost track of the previous button :/")
             return
         LOGGER.info(f"Un-focusing widget {widgets[i]}")
+        IdleScreen.mark_dirty(widgets[i])
         widgets[i].border_color = GREY
         widgets[i].shape.set_border_and_fix_center(0)
 
+    def mark_changes(self, event):
+        """Flag what the event may change: the widgets under the mouse or with the focus, or everything."""
+
+        if event.type == pygame.MOUSEMOTION:
+            before = event.pos[0] - event.rel[0], event.pos[1] - event.rel[1]
+            self.mark_dirty(*(widget for widget in self.widgets
+                              if widget.absolute_rect.collidepoint(event.pos)
+                              or widget.absolute_rect.collidepoint(before)))
+        elif event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in (pygame.K_UP, pygame.K_DOWN, pygame.K_TAB):
+            # moving the focus, the widgets losing and getting it are marked by (un)focus_render
+            self.mark_dirty(*(widget for widget in self.widgets if widget.focus))
+        else:
+            # clicks and validations can do anything
+            self.changed = True
+
     def update(self, event):
+        self.mark_changes(event)
         if self.focused_button_index == -1:
             return
 
@@ -103,6 +103,7 @@ class KeyBindingsScreen(IdleScreen):
 
                 self.hint_label.visible = False
                 self.binding_setting = None
+                self.mark_dirty(wid, self.hint_label)
                 return True
         super().update(event)
 
@@ -0,0 +1,341 @@
+"""
+The logic of a run on a level, one fixed tick at a time.
+
+It knows nothing about the display nor the time, so it can run in a window
+(see GameScreen) or without one, as fast as possible (see headless.py and replay.py).
+SimulationThread runs it on its own thread, in real time.
+"""
+import logging
+import queue
+import struct
+import threading
+import weakref
+import zlib
+from time import perf_counter, sleep
+from typing import TYPE_CHECKING
+import numpy as np
+
+from config import CONFIG
+from helper import get_state, set_state, RecordingSurface
+from level import Level
+from physics import Pos, AABB, CollisionData, CollisionType, ProjectileView
+from player import Player
+
+if TYPE_CHECKING:
+    from replay import Replay
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Simulation:
+    UPDATE_FPS = 60  # ticks per second of game time
+
+    def __init__(self, level, screen_size):
+        self.level = level
+        self.screen_size = screen_size
+        self.tick = 0
+        self.deaths = 0
+        self.player = None  # type: Player
+        self.recorder = None  # type: Replay
+        self.spawn_player()
+
+    @property
+    def space(self):
+        return self.level.space
+
+    def spawn_player(self, respawn=False):
+        self.player = Player(self.level.world_start, respawn=respawn)
+        self.space.add(self.player)
+        self.level.screen_size = Pos(self.screen_size)
+        self.level.update_offset(self.level.world_start, self.screen_size)
+
+    def update(self, event):
+        """Pass an input event to the player."""
+        if self.recorder is not None:
+            self.recorder.record(self.tick, event)
+        return self.player.update(event)
+
+    def step(self):
+        """Advance the game by one tick."""
+
+        if self.level.over:
+            return
+
+        if self.level.to_reset:
+            LOGGER.info("Level is resetting (it means the player died, in case you weren't aware of that)")
+            self.level = Level.load_num(self.level.num)
+            self.spawn_player(respawn=True)
+            self.deaths += 1
+        elif self.level.exploding:
+            self.level.internal_logic()
+        else:
+            self.space.simulate()
+            self.level.update_offset(self.player.center, self.screen_size)
+            self.level.internal_logic()
+
+        self.tick += 1
+        if self.recorder is not None:
+            self.recorder.record_tick(self)
+
+    def frame(self, previous=None, shared=False):
+        """
+        What the display shows of the current tick, see Frame.
+
+        Previous are the positions of the level before the tick (see Level.positions), to draw the frames
+        until the next tick between them and the current ones. Shared means that the frame is drawn from
+        another thread, while the next ticks run.
+        """
+
+        level = self.level
+        frame = Frame()
+        frame.level = level
+        frame.tick = self.tick
+        frame.offset = Pos(level.offset)
+        frame.previous_offset = Pos(previous[0]) if previous is not None else frame.offset
+        frame.sprites = []
+        frame.explosion = None
+        frame.time = perf_counter()
+
+        if level.exploding:
+            frame.explosion = RecordingSurface(self.screen_size)
+            level.explosion.render(frame.explosion)
+            if shared:
+                level.explosion.share()
+            frame.still = True  # the explosion only changes on ticks
+            return frame
+
+        # the sprites are recorded at their world position, the previous one is shifted like the body
+        recording = RecordingSurface(self.screen_size)
+        before = previous[1] if previous is not None else {}
+        for body in self.space.moving_bodies + self.space.projectiles:
+            start = len(recording.calls)
+            body.render(recording, Pos(0, 0))
+            shift = before.get(body, body.shape.topleft) - body.shape.topleft
+            for _, (source, dest, area, _) in recording.calls[start:]:
+                frame.sprites.append((source, Pos(dest), Pos(dest) + shift, area))
+
+        now = RecordingSurface(self.screen_size)
+        then = RecordingSurface(self.screen_size)
+        for view in level.brochettes.views():
+            view.render(now, Pos(0, 0))
+        for view in level.brochettes.views(0.0 if previous is not None else 1.0):
+            view.render(then, Pos(0, 0))
+        for (_, (source, dest, area, _)), (_, (_, dest_before, _, _)) in zip(now.calls, then.calls):
+            frame.sprites.append((source, Pos(dest), Pos(dest_before), area))
+
+        frame.still = (previous is not None and level.positions() == previous
+                       and not level.brochettes.moving())
+        return frame
+
+    def checksum(self):
+        """A hash of the state of the game, to check that two runs are the same."""
+        values = [self.tick, self.deaths]
+        for body in self.space.moving_bodies + self.space.projectiles:
+            values.extend(body.shape.topleft)
+            values.extend(body.velocity)
+        for array in self.space.projectile_arrays:
+            n = len(array)
+            values.extend(np.hstack((array.pos[:n], array.velocity[:n])).ravel().tolist())
+        return zlib.crc32(struct.pack(f"{len(values)}d", *values))
+
+    def snapshot(self):
+        """Copy the state of the run, so it can be put back with restore. Not possible during the explosion."""
+
+        assert not self.level.exploding, "Cannot snapshot an exploding level"
+
+        bodies = self.space.projectiles + self.space.moving_bodies
+        self.level.sync_timers()
+
+        def collision_ref(colli):
+            if colli.type is CollisionType.BLOCK:
+                ref = self.level.world_to_map(colli.shape.topleft)
+            elif isinstance(colli.object, ProjectileView):
+                ref = colli.object  # views are copies, they can be shared
+            else:
+                ref = bodies.index(colli.object)
+            return colli.type, ref, AABB(colli.shape)
+
+        return {
+            "tick": self.tick,
+            "deaths": self.deaths,
+            "to_reset": self.level.to_reset,
+            "offset": Pos(self.level.offset),
+            "ak47_collected": CONFIG.levels_stats[str(self.level.num)][2],
+            "blocks": {pos: get_state(self.level.get_block(pos)) for pos in self.level.stateful_blocks},
+            "bodies": [(type(body), body.snapshot(), [collision_ref(colli) for colli in body.collisions])
+                       for body in bodies],
+            "player": bodies.index(self.player),
+            "arrays": [array.snapshot() for array in self.space.projectile_arrays],
+        }
+
+    def restore(self, snapshot):
+        """Put back the run in the state it had when the snapshot was taken."""
+
+        # the AK47 spawns only if it was not collected, the projectiles are replaced anyway
+        CONFIG.levels_stats[str(self.level.num)][2] = snapshot["ak47_collected"]
+        self.level = Level.load_num(self.level.num)
+        self.level.screen_size = Pos(self.screen_size)
+        self.level.offset = Pos(snapshot["offset"])
+        self.level.to_reset = snapshot["to_reset"]
+        self.tick = snapshot["tick"]
+        self.deaths = snapshot["deaths"]
+
+        for pos, state in snapshot["blocks"].items():
+            set_state(self.level.get_block(pos), state)
+
+        space = self.space
+        for body in space.projectiles + space.moving_bodies:
+            space.remove(body)
+        bodies = []
+        for cls, state, _ in snapshot["bodies"]:
+            body = cls.__new__(cls)
+            body.restore(state)
+            body.collisions = []
+            space.add(body)
+            bodies.append(body)
+
+        for body, (_, _, collisions) in zip(bodies, snapshot["bodies"]):
+            for type, ref, shape in collisions:
+                if type is CollisionType.BLOCK:
+                    obj = self.level.get_block(ref)
+                elif isinstance(ref, ProjectileView):
+                    obj = ref
+                else:
+                    obj = bodies[ref]
+                body.collisions.append(CollisionData(type, obj, AABB(shape)))
+
+        self.player = bodies[snapshot["player"]]
+
+        for array, state in zip(space.projectile_arrays, snapshot["arrays"]):
+            array.restore(state)
+
+
+class Frame:
+    """
+    What the display shows of one tick, made by Simulation.frame. It does not change once made,
+    so it can be drawn from another thread than the one running the simulation.
+
+    The sprites of the bodies and brochettes are (image, position, previous position, area)
+    in the world, the explosion a RecordingSurface of what it draws.
+    """
+
+    __slots__ = ("level", "tick", "offset", "previous_offset", "sprites", "explosion", "still", "time")
+
+    def camera(self, alpha=1.0):
+        """The offset of the display alpha of the way from the previous tick to this one."""
+        return self.previous_offset + (self.offset - self.previous_offset) * alpha
+
+    def render(self, surf, rects=None, alpha=1.0):
+        """Like Level.render: what moves is drawn alpha of the way from the previous tick to this one."""
+
+        if self.explosion is not None:
+            self.explosion.replay(surf)
+            return None
+
+        offset = self.camera(alpha)
+        moving = self.level.render_blocks(surf, offset, rects)
+        moving.blits([(source, before + (pos - before) * alpha - offset, area)
+                      for source, pos, before, area in self.sprites])
+        return moving.rects
+
+
+class SimulationThread:
+    """
+    Run a simulation on its own thread, at UPDATE_FPS ticks per second, so a slow frame does not delay the ticks.
+
+    Each tick publishes its Frame in a double buffer that the display reads with frame. The inputs are
+    queued with the tick of the frame they were sent from, and passed to the simulation before the next tick.
+    Nothing runs while the level is over or resetting: the screen does it with step, after its fade.
+    """
+
+    UPDATE_FPS = Simulation.UPDATE_FPS
+    MAX_CATCH_UP = 5  # ticks run at once at most, the game slows down past that instead of spiraling
+
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+        self.lock = threading.Lock()  # held during a tick
+        self.inputs = queue.SimpleQueue()  # (tick of the frame shown, event)
+        self.frames = [simulation.frame(), None]  # the display reads the front one, the next is written in the other
+        self.front = 0
+        self.next_tick = 0
+        self.paused = False
+        self.stopped = False
+        # the thread only keeps a weak reference between two ticks, to stop when the screen forgets the simulation
+        self.thread = threading.Thread(target=run_thread, args=(weakref.ref(self),), name="simulation", daemon=True)
+
+    @property
+    def frame(self) -> Frame:
+        """The frame of the last tick."""
+        return self.frames[self.front]
+
+    def start(self):
+        self.next_tick = perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def resize(self, screen_size):
+        """Change the size of the display the camera follows the player on."""
+        if self.simulation.screen_size != screen_size:
+            with self.lock:
+                self.simulation.screen_size = screen_size
+
+    def send(self, event):
+        """Queue an input event for the next tick."""
+        self.inputs.put((self.frame.tick, event))
+
+    def step(self):
+        """Run one tick with the inputs sent until now, and publish its frame."""
+
+        with self.lock:
+            simulation = self.simulation
+            while True:
+                try:
+                    tick, event = self.inputs.get_nowait()
+                except queue.Empty:
+                    break
+                if simulation.tick - tick > self.MAX_CATCH_UP:
+                    LOGGER.debug(f"Input sent {simulation.tick - tick} ticks ago, the display lags behind")
+                simulation.update(event)
+
+            level = simulation.level
+            previous = level.positions()
+            simulation.step()
+            frame = simulation.frame(previous if simulation.level is level else None, shared=True)
+
+            # the frames never change once published, so swapping the index is all the display needs to see
+            self.frames[1 - self.front] = frame
+            self.front = 1 - self.front
+
+    def advance(self):
+        """Run the ticks that are due. Return the seconds to wait until the next one."""
+
+        now = perf_counter()
+        level = self.simulation.level
+        if self.paused or level.over or level.to_reset:
+            self.next_tick = now + 1 / self.UPDATE_FPS  # nothing to catch up once it runs again
+            return 1 / self.UPDATE_FPS
+
+        late = now - self.next_tick
+        if late > self.MAX_CATCH_UP / self.UPDATE_FPS:
+            LOGGER.debug(f"Dropping {late * self.UPDATE_FPS - self.MAX_CATCH_UP:.1f} ticks late")
+            self.next_tick = now - (self.MAX_CATCH_UP - 1) / self.UPDATE_FPS
+
+        while self.next_tick <= now and not (self.paused or self.simulation.level.over
+                                             or self.simulation.level.to_reset):
+            self.step()
+            self.next_tick += 1 / self.UPDATE_FPS
+        return max(self.next_tick - perf_counter(), 0)
+
+
+def run_thread(ref):
+    """The loop of the thread of a SimulationThread."""
+
+    while True:
+        runner = ref()  # type: SimulationThread
+        if runner is None or runner.stopped:
+            return
+        delay = runner.advance()
+        del runner
+        sleep(delay)
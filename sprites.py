@@ -0,0 +1,83 @@
+"""
+Cache of the small surfaces drawn every frame: block sprites, editor cursor...
+
+Each of them is made once, converted to the display format and kept until the
+cache goes over its budget, then the least recently used ones are dropped.
+The cache is shared by the display and the simulation thread, so it is locked.
+"""
+import logging
+import threading
+from collections import OrderedDict
+import pygame
+
+from constants import SPRITE_CACHE_BUDGET
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SpriteCache:
+    def __init__(self, budget=SPRITE_CACHE_BUDGET):
+        """Create an empty cache that holds at most budget bytes of surfaces."""
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.sprites = OrderedDict()  # the least recently used first
+        self.lock = threading.RLock()  # factories may draw other sprites
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def __str__(self):
+        return (f"<SpriteCache: {len(self)} sprites, {self.size // 1024}/{self.budget // 1024}kB, "
+                f"{self.hits} hits, {self.misses} misses>")
+
+    def get(self, key, factory):
+        """Return the sprite for key, creating it with factory() if it isn't in the cache."""
+
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.hits += 1
+                self.sprites.move_to_end(key)
+                return sprite
+
+            self.misses += 1
+            sprite = self.convert(factory())
+            self.sprites[key] = sprite
+            self.size += self.bytes_of(sprite)
+
+            # we keep at least the one just created, even if it is too big
+            while self.size > self.budget and len(self.sprites) > 1:
+                _, old = self.sprites.popitem(last=False)
+                self.size -= self.bytes_of(old)
+
+            return sprite
+
+    def clear(self):
+        with self.lock:
+            LOGGER.info("Clearing %s", self)
+            self.sprites.clear()
+            self.size = 0
+
+    @staticmethod
+    def convert(sprite: pygame.Surface):
+        """Convert the sprite to the display format, so it can be blitted fast."""
+        if pygame.display.get_surface() is None:
+            return sprite
+        if sprite.get_flags() & pygame.SRCALPHA:
+            return sprite.convert_alpha()
+
+        alpha = sprite.get_alpha()
+        converted = sprite.convert()
+        if alpha is not None:
+            # convert() forgets the surface alpha
+            converted.set_alpha(alpha)
+        return converted
+
+    @staticmethod
+    def bytes_of(sprite: pygame.Surface):
+        return sprite.get_pitch() * sprite.get_height()
+
+
+SPRITES = SpriteCache()